@@ -0,0 +1,120 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from core.versions import get_version, shared_cache
+from .routers import primary
+
+
+class LocalLRUCache:
+    """Кеш в памяти воркера, вытесняет давно не читанные ключи."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+local_cache = LocalLRUCache(settings.REFERENCE_CACHE_LOCAL_SIZE)
+latest = {}
+latest_lock = threading.Lock()
+
+
+def get_or_build(namespace, key, builder, shared=True):
+    """
+    Значение из локального LRU, затем из общего кеша;
+    при промахе builder() строится по основной базе и кладётся в оба.
+    shared=False для объектов, которые незачем сериализовать в общий кеш.
+    """
+    full_key = f'{namespace}:{get_version(namespace)}:{key}'
+    value = local_cache.get(full_key)
+    if value is not None:
+        return value
+    cache = shared_cache()
+    value = cache.get(full_key) if shared else None
+    if value is None:
+        with primary():
+            value = builder()
+        if shared:
+            cache.set(full_key, value, settings.REFERENCE_CACHE_TIMEOUT)
+    local_cache.set(full_key, value)
+    return value
+
+
+def get_latest(namespace, key, builder):
+    """
+    Одно значение на ключ в памяти воркера, только для текущей версии:
+    при смене версии builder() строит новое и заменяет старое.
+    Для больших индексов по всему каталогу, которые незачем держать
+    в LRU по копии на каждую версию.
+    """
+    version = get_version(namespace)
+    slot = latest.get((namespace, key))
+    if slot is not None and slot[0] == version:
+        return slot[1]
+    with primary():
+        value = builder()
+    with latest_lock:
+        latest[(namespace, key)] = (version, value)
+    return value
+
+
+def get_or_revalidate(key, generation, builder, fresh, stale):
+    """
+    Значение из общего кеша со stale-while-revalidate: устаревшее
+    по времени или по поколению значение пересобирает один запрос,
+    взявший блокировку, остальные пока получают старое.
+    builder() может вернуть None — такое значение не кешируется.
+    """
+    cache = shared_cache()
+    entry = cache.get(key)
+    now = time.time()
+    if entry is not None:
+        if entry['generation'] == generation and entry['expires'] > now:
+            return entry['value']
+        if not cache.add(
+            f'{key}:lock', 1, settings.RESPONSE_CACHE_LOCK_TIMEOUT
+        ):
+            return entry['value']
+    try:
+        with primary():
+            value = builder()
+        if value is not None:
+            cache.set(
+                key,
+                {
+                    'generation': generation,
+                    'expires': now + fresh,
+                    'value': value,
+                },
+                fresh + stale
+            )
+    finally:
+        if entry is not None:
+            cache.delete(f'{key}:lock')
+    return value
+
+
+def make_etag(content):
+    return f'"{hashlib.md5(content).hexdigest()}"'
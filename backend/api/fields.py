@@ -0,0 +1,31 @@
+from django.core.files import File
+from drf_extra_fields.fields import Base64ImageField
+from rest_framework import serializers
+
+from recipes.images import rendition_urls
+
+
+class RecipeImageField(Base64ImageField):
+    """
+    Base64ImageField, который принимает и уже декодированный
+    RecipeJSONParser файл.
+    """
+
+    def to_internal_value(self, data):
+        if not isinstance(data, File):
+            return super().to_internal_value(data)
+        if data.name.rsplit('.', 1)[-1] not in self.ALLOWED_TYPES:
+            raise serializers.ValidationError(self.INVALID_TYPE_MESSAGE)
+        return serializers.ImageField.to_internal_value(self, data)
+
+
+class ImageRenditionsField(serializers.Field):
+    """Ссылки на уменьшенные копии картинки рецепта."""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        return rendition_urls(recipe, self.context.get('request'))
@@ -1,25 +1,68 @@
-from django_filters.filters import (ChoiceFilter, NumberFilter)
-from django_filters.rest_framework import FilterSet, ModelMultipleChoiceFilter
-from rest_framework.filters import SearchFilter
+from django.conf import settings
+from django.db.models import Case, Exists, IntegerField, OuterRef, Value, When
+from django_filters.filters import (
+    CharFilter, ChoiceFilter, MultipleChoiceFilter, NumberFilter
+)
+from django_filters.rest_framework import FilterSet
+from rest_framework.filters import BaseFilterBackend
 
 from recipes.models import Recipe, Tag
+from .cache import get_or_build
+from .search import ingredient_index, order_by_ids, search_recipes
 
 RECIPE_CHOICES = (
     (0, 'Not_In_List'),
     (1, 'In_List'),
 )
+ORDERING_CHOICES = (
+    ('popular', 'popular'),
+)
+
+
+def tag_slug_map():
+    """slug -> id всех тегов из кеша справочников."""
+    return get_or_build(
+        'tags', 'slugs', lambda: dict(Tag.objects.values_list('slug', 'id'))
+    )
+
+
+def tag_choices():
+    return [(slug, slug) for slug in tag_slug_map()]
 
 
-class IngredientFilter(SearchFilter):
+class IngredientFilter(BaseFilterBackend):
+    """
+    Автодополнение ингредиентов: сначала совпадения по началу
+    названия, затем по вхождению, не больше INGREDIENT_SEARCH_LIMIT.
+    """
     search_param = 'name'
 
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        limit = settings.INGREDIENT_SEARCH_LIMIT
+        if settings.INGREDIENT_SEARCH_BACKEND == 'database':
+            return self.database_search(queryset, query, limit)
+        ids = ingredient_index().search(query, limit)
+        return order_by_ids(queryset, ids)
+
+    def database_search(self, queryset, query, limit):
+        """На Postgres обслуживается trigram-индексом по UPPER(name)."""
+        return queryset.filter(name__icontains=query).annotate(
+            is_prefix_match=Case(
+                When(name__istartswith=query, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField(),
+            )
+        ).order_by('is_prefix_match', 'name')[:limit]
+
 
 class RecipeFilter(FilterSet):
     author = NumberFilter(field_name='author__id', lookup_expr='exact')
-    tags = ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all()
+    tags = MultipleChoiceFilter(
+        choices=tag_choices,
+        method='filter_tags'
     )
     is_in_shopping_cart = ChoiceFilter(
         choices=RECIPE_CHOICES,
@@ -29,6 +72,28 @@ class RecipeFilter(FilterSet):
         choices=RECIPE_CHOICES,
         method='get_is_in'
     )
+    search = CharFilter(method='filter_search')
+    ordering = ChoiceFilter(
+        choices=ORDERING_CHOICES,
+        method='filter_ordering'
+    )
+
+    def filter_tags(self, queryset, name, value):
+        """Рецепты хотя бы с одним из тегов, одним EXISTS без дублей."""
+        slugs = tag_slug_map()
+        return queryset.annotate(has_tags=Exists(
+            Recipe.tags.through.objects.filter(
+                recipe_id=OuterRef('pk'),
+                tag_id__in=[slugs[slug] for slug in value]
+            )
+        )).filter(has_tags=True)
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def filter_ordering(self, queryset, name, value):
+        """Популярные по числу добавлений в избранное."""
+        return queryset.order_by('-favorites_count', '-pub_date', '-id')
 
     def get_is_in(self, queryset, name, value):
         user = self.request.user
@@ -44,4 +109,5 @@ class RecipeFilter(FilterSet):
     class Meta:
         model = Recipe
         fields = ('tags', 'author',
-                  'is_favorited', 'is_in_shopping_cart')
+                  'is_favorited', 'is_in_shopping_cart', 'search',
+                  'ordering')
@@ -0,0 +1,62 @@
+import heapq
+from array import array
+from collections import Counter
+from itertools import chain
+
+from recipes.models import AmountImgredientsInRecipe
+from .cache import get_latest
+
+
+class IngredientMatchIndex:
+    """
+    Наборы ингредиентов всех рецептов в памяти: для каждого ингредиента
+    сортированный массив позиций рецептов, для каждой позиции — id рецепта
+    и число ингредиентов в нём. Совпадения по запросу считаются
+    слиянием массивов без обращения к базе.
+    """
+
+    def __init__(self, rows):
+        self.recipe_ids = array('q')
+        self.sizes = array('l')
+        postings = {}
+        for recipe_id, ingredient_id in rows:
+            if not self.recipe_ids or self.recipe_ids[-1] != recipe_id:
+                self.recipe_ids.append(recipe_id)
+                self.sizes.append(0)
+            position = len(self.recipe_ids) - 1
+            self.sizes[position] += 1
+            postings.setdefault(ingredient_id, array('l')).append(position)
+        self.postings = postings
+
+    def match(self, ingredient_ids, limit):
+        """
+        Лучшие limit рецептов: меньше недостающих ингредиентов,
+        затем больше совпавших, затем новее.
+        Возвращает список (id рецепта, совпало, не хватает).
+        """
+        matched = Counter(chain.from_iterable(
+            self.postings.get(pk, ()) for pk in set(ingredient_ids)
+        ))
+        best = heapq.nsmallest(
+            limit,
+            matched.items(),
+            key=lambda item: (
+                self.sizes[item[0]] - item[1], -item[1], -item[0]
+            )
+        )
+        return [
+            (self.recipe_ids[position], count, self.sizes[position] - count)
+            for position, count in best
+        ]
+
+
+def ingredient_match_index():
+    return get_latest(
+        'recipes',
+        'match',
+        lambda: IngredientMatchIndex(
+            AmountImgredientsInRecipe.objects.values_list(
+                'recipe_id', 'ingredient_id'
+            ).order_by('recipe_id').iterator()
+        )
+    )
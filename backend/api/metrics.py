@@ -0,0 +1,213 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+LITERAL = re.compile(r"'[^']*'|\b\d+\b")
+
+requests = deque(maxlen=settings.METRICS_BUFFER_SIZE)
+totals = defaultdict(Counter)
+totals_lock = threading.Lock()
+
+
+COUNTED = ('queries', 'duplicates', 'sql_time', 'render_time', 'total_time')
+
+
+class QueryBudgetExceeded(Exception):
+    """Эндпоинт сделал больше запросов, чем заявлено в QUERY_BUDGETS."""
+
+
+def fingerprint(sql):
+    """SQL без значений: одинаковые запросы с разными id совпадают."""
+    return LITERAL.sub('?', IN_LIST.sub('IN (...)', sql))
+
+
+class QueryRecorder:
+    """execute_wrapper: считает запросы, их время и повторы."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self):
+        return {
+            sql: count for sql, count in self.fingerprints.items()
+            if count > 1
+        }
+
+
+def endpoint_name(request):
+    """ViewSet.action для DRF, иначе имя урла."""
+    match = request.resolver_match
+    if match is None:
+        return 'unknown'
+    view = match.func
+    actions = getattr(view, 'actions', None)
+    cls = getattr(view, 'cls', None)
+    if cls is not None and actions:
+        action = actions.get(request.method.lower(), request.method.lower())
+        return f'{cls.__name__}.{action}'
+    if cls is not None:
+        return cls.__name__
+    return match.view_name
+
+
+class QueryMetricsMiddleware:
+    """
+    Для каждого запроса пишет в кольцевой буфер число SQL-запросов,
+    повторы, время SQL, отрисовки ответа и общее. Превышение
+    QUERY_BUDGETS логируется, а при QUERY_BUDGET_STRICT — ошибка.
+    Потоковый ответ учитывается, когда сервер дочитал его до конца;
+    заголовки X-Query-* в нём покрывают только работу view.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        request.render_time = 0.0
+        started = time.perf_counter()
+        with self.recording(recorder):
+            response = self.get_response(request)
+        if settings.METRICS_HEADERS:
+            response['X-Query-Count'] = recorder.count
+            response['X-Query-Time'] = f'{recorder.duration * 1000:.1f}'
+        if response.streaming:
+            response.streaming_content = self.stream(
+                response.streaming_content, request, response,
+                recorder, started
+            )
+            return response
+        self.record(request, response, recorder, started)
+        return response
+
+    def recording(self, recorder):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        return stack
+
+    def stream(self, content, request, response, recorder, started):
+        """Запросы, сделанные при отдаче тела, тоже попадают в метрики."""
+        try:
+            with self.recording(recorder):
+                yield from content
+        finally:
+            self.record(request, response, recorder, started, strict=False)
+
+    def record(self, request, response, recorder, started, strict=True):
+        total = time.perf_counter() - started
+        endpoint = endpoint_name(request)
+        duplicates = recorder.duplicates()
+        record = {
+            'endpoint': endpoint,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'duplicates': sum(duplicates.values()) - len(duplicates),
+            'sql_time': recorder.duration,
+            'render_time': request.render_time,
+            'total_time': total,
+        }
+        requests.append(record)
+        with totals_lock:
+            counter = totals[endpoint]
+            counter['requests'] += 1
+            for field in COUNTED:
+                counter[field] += record[field]
+        for sql, count in duplicates.items():
+            if count >= settings.METRICS_DUPLICATE_THRESHOLD:
+                logger.warning(
+                    '%s: запрос повторён %s раз: %s', endpoint, count, sql
+                )
+        self.check_budget(endpoint, recorder.count, strict)
+
+    def process_template_response(self, request, response):
+        """DRF-ответ отрисовывается после этого хука, засекаем render()."""
+        started = time.perf_counter()
+
+        def rendered(response):
+            request.render_time = time.perf_counter() - started
+        response.add_post_render_callback(rendered)
+        return response
+
+    def check_budget(self, endpoint, count, strict=True):
+        budget = settings.QUERY_BUDGETS.get(endpoint)
+        if budget is None or count <= budget:
+            return
+        message = f'{endpoint}: {count} запросов при бюджете {budget}'
+        if strict and settings.QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+
+def quantile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def prometheus_metrics():
+    """
+    Счётчики *_total накоплены с запуска процесса, квантили и максимум
+    считаются по кольцевому буферу последних запросов.
+    """
+    by_endpoint = defaultdict(list)
+    for record in list(requests):
+        by_endpoint[record['endpoint']].append(record)
+    with totals_lock:
+        snapshot = {
+            endpoint: dict(counter) for endpoint, counter in totals.items()
+        }
+    lines = []
+    counters = (
+        ('requests', 'requests', 'Запросы'),
+        ('queries', 'queries', 'SQL-запросы'),
+        ('duplicate_queries', 'duplicates', 'Повторные SQL-запросы'),
+        ('sql_seconds', 'sql_time', 'Время SQL'),
+        ('render_seconds', 'render_time', 'Время отрисовки ответа'),
+        ('request_seconds', 'total_time', 'Время ответа'),
+    )
+    for name, field, description in counters:
+        lines.append(f'# HELP foodgram_{name}_total {description}')
+        lines.append(f'# TYPE foodgram_{name}_total counter')
+        for endpoint, counter in sorted(snapshot.items()):
+            lines.append(
+                f'foodgram_{name}_total{{endpoint="{endpoint}"}} '
+                f'{counter[field]}'
+            )
+    lines.append('# HELP foodgram_request_latency_seconds Время ответа')
+    lines.append('# TYPE foodgram_request_latency_seconds summary')
+    for endpoint, records in sorted(by_endpoint.items()):
+        latencies = [record['total_time'] for record in records]
+        for fraction in (0.5, 0.95, 0.99):
+            lines.append(
+                'foodgram_request_latency_seconds'
+                f'{{endpoint="{endpoint}",quantile="{fraction}"}} '
+                f'{quantile(latencies, fraction):.6f}'
+            )
+    lines.append('# HELP foodgram_max_queries Максимум SQL-запросов')
+    lines.append('# TYPE foodgram_max_queries gauge')
+    for endpoint, records in sorted(by_endpoint.items()):
+        lines.append(
+            f'foodgram_max_queries{{endpoint="{endpoint}"}} '
+            f'{max(record["queries"] for record in records)}'
+        )
+    return '\n'.join(lines) + '\n'
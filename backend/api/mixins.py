@@ -1,4 +1,16 @@
-from rest_framework import mixins, viewsets
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import urlencode
+from rest_framework import mixins, status, viewsets
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from core.versions import get_versions
+from recipes.models import Recipe
+
+from .cache import get_or_build, get_or_revalidate, make_etag
+from .personalization import personalize, recipe_representations, user_flags
 
 
 class CreateRetrieveViewSet(
@@ -15,3 +27,153 @@ class ListRetrieveViewSet(
     viewsets.GenericViewSet,
 ):
     pass
+
+
+def json_response(request, etag, content):
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(
+            content,
+            content_type='application/json',
+            status=status.HTTP_200_OK
+        )
+    response['ETag'] = etag
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+class CachedReferenceMixin:
+    """
+    Отдаёт list/retrieve справочника готовым JSON из кеша
+    и отвечает 304 на совпавший If-None-Match.
+    """
+    cache_namespace = None
+
+    def get_cache_key(self, request, **kwargs):
+        params = urlencode(sorted(request.query_params.lists()), doseq=True)
+        return f'{self.action}:{kwargs.get("pk", "")}:{params}'
+
+    def render_cached(self, handler, request, *args, **kwargs):
+        response = handler(request, *args, **kwargs)
+        content = JSONRenderer().render(response.data)
+        return make_etag(content), content
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        etag, content = get_or_build(
+            self.cache_namespace,
+            self.get_cache_key(request, **kwargs),
+            lambda: self.render_cached(handler, request, *args, **kwargs)
+        )
+        return json_response(request, etag, content)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+
+class AnonymousResponseCacheMixin:
+    """
+    Кеширует готовый JSON list/retrieve для анонимов: флаги
+    пользователя у них всегда false, ответ у всех одинаковый.
+    Кешируются только запросы с параметрами из cache_params,
+    поколение ответа — версии cache_namespaces.
+    """
+    cache_params = ('page', 'limit', 'tags', 'author')
+    cache_namespaces = ('recipes', 'tags', 'ingredients', 'users')
+
+    def get_response_cache_key(self, request, **kwargs):
+        params = request.query_params
+        if not set(params).issubset(self.cache_params):
+            return None
+        normalized = sorted(
+            (name, sorted(set(params.getlist(name))))
+            for name in params if any(params.getlist(name))
+        )
+        return (
+            f'response:{self.basename}:{self.action}:{kwargs.get("pk", "")}:'
+            f'{request.get_host()}:{urlencode(normalized, doseq=True)}'
+        )
+
+    def anonymous_response(self, handler, request, *args, **kwargs):
+        key = None
+        if request.user.is_anonymous:
+            key = self.get_response_cache_key(request, **kwargs)
+        if key is None:
+            return handler(request, *args, **kwargs)
+        uncached = []
+
+        def build():
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                uncached.append(response)
+                return None
+            content = JSONRenderer().render(response.data)
+            return make_etag(content), content
+
+        cached = get_or_revalidate(
+            key,
+            get_versions(*self.cache_namespaces),
+            build,
+            settings.RESPONSE_CACHE_FRESH,
+            settings.RESPONSE_CACHE_STALE,
+        )
+        if cached is None:
+            return uncached[0]
+        return json_response(request, *cached)
+
+    def list(self, request, *args, **kwargs):
+        return self.anonymous_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.anonymous_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+
+class PersonalizedRecipeMixin:
+    """
+    list/retrieve рецептов из общих закешированных представлений:
+    из базы берутся только id страницы, флаги пользователя
+    накладываются из его множеств id.
+    """
+    page_only_fields = ('id', 'pub_date')
+
+    def personalized(self, recipe_ids):
+        representations = recipe_representations(
+            recipe_ids, self.request, self.get_serializer_class()
+        )
+        flags = user_flags(self.request.user)
+        return [
+            personalize(representations[pk], flags)
+            for pk in recipe_ids if pk in representations
+        ]
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(
+            Recipe.objects.only(*self.page_only_fields)
+        )
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(self.personalized([
+                recipe.id for recipe in queryset
+            ]))
+        return self.get_paginated_response(
+            self.personalized([recipe.id for recipe in page])
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            recipe_id = int(kwargs[self.lookup_field])
+        except ValueError:
+            raise Http404
+        data = self.personalized([recipe_id])
+        if not data:
+            raise Http404
+        return Response(data[0])
@@ -1,5 +1,159 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import hashlib
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def estimated_count(queryset):
+    """Оценка числа строк из статистики Postgres для выборки без WHERE."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql' or queryset.query.where:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples FROM pg_class WHERE relname = %s',
+            [queryset.model._meta.db_table]
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] <= 0:
+        return None
+    return int(row[0])
+
+
+class CountModePaginator(Paginator):
+    """
+    Paginator, который по PAGINATION_COUNT_MODE может не считать COUNT(*)
+    на каждой странице: estimate берёт оценку из pg_class,
+    cached кеширует точное значение на PAGINATION_COUNT_CACHE_TIMEOUT.
+    """
+
+    @cached_property
+    def count(self):
+        mode = settings.PAGINATION_COUNT_MODE
+        if mode == 'exact' or not hasattr(self.object_list, 'query'):
+            return super().count
+        if mode == 'estimate':
+            count = estimated_count(self.object_list)
+            if count is not None:
+                return count
+        key = 'count:' + hashlib.md5(
+            str(self.object_list.query).encode()
+        ).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = super().count
+            cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+        return count
+
+
+class KeysetPagination(BasePagination):
+    """
+    Курсорная пагинация по паре (поле, id) без OFFSET и COUNT(*).
+    Курсор хранит значения последней строки страницы.
+    """
+    cursor_query_param = 'cursor'
+
+    def __init__(self, ordering, page_size):
+        self.ordering = ordering
+        self.page_size = page_size
+
+    def encode_cursor(self, instance):
+        values = [
+            str(getattr(instance, field.lstrip('-')))
+            for field in self.ordering
+        ]
+        return base64.urlsafe_b64encode(
+            json.dumps(values).encode()
+        ).decode()
+
+    def decode_cursor(self, queryset, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return [
+                queryset.model._meta.get_field(field.lstrip('-')).to_python(
+                    value
+                )
+                for field, value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError, AttributeError, ValidationError):
+            raise NotFound('Неверный курсор.')
+
+    def after(self, position):
+        """Условие «строго после position» для составного ключа."""
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(
+                self.after(self.decode_cursor(queryset, cursor))
+            )
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            remove_query_param(self.request.build_absolute_uri(), 'page'),
+            self.cursor_query_param,
+            self.encode_cursor(self.page[-1])
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', None),
+            ('results', data),
+        ]))
 
 
 class CustomPageNumberPaginator(PageNumberPagination):
+    """
+    Постраничная пагинация с параметрами page и limit.
+    С параметром cursor (в том числе пустым) включается курсорный режим
+    по cursor_ordering вьюхи.
+    """
     page_size_query_param = 'limit'
+    django_paginator_class = CountModePaginator
+    keyset = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = getattr(view, 'cursor_ordering', None)
+        if ordering and KeysetPagination.cursor_query_param in (
+            request.query_params
+        ):
+            self.keyset = KeysetPagination(
+                ordering, self.get_page_size(request)
+            )
+            return self.keyset.paginate_queryset(queryset, request, view)
+        self.keyset = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
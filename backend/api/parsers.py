@@ -0,0 +1,253 @@
+import binascii
+import json
+import logging
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+
+logger = logging.getLogger(__name__)
+
+QUOTE, BACKSLASH = ord('"'), ord('\\')
+COLON = ord(':')
+OPENING, CLOSING = b'{[', b'}]'
+WHITESPACE = b' \t\r\n'
+DATA_URI_PREFIX = b'data:'
+IMAGE_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif'}
+
+
+class PayloadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Слишком большой запрос.'
+    default_code = 'payload_too_large'
+
+
+class ImageMemberExtractor:
+    """
+    Разбирает JSON по частям и вырезает строку верхнеуровневого ключа
+    field: base64 из неё декодируется сразу во временный файл,
+    а в оставшемся JSON на её месте остаётся null.
+    """
+
+    def __init__(self, field):
+        self.field = field.encode()
+        self.output = bytearray()
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.string = bytearray()
+        self.pending_key = None
+        self.key = None
+        self.in_image = False
+        self.header = bytearray()
+        self.header_done = False
+        self.carry = b''
+        self.pending = bytearray()
+        self.file = None
+        self.size = 0
+        self.decode_time = 0.0
+
+    def feed(self, chunk):
+        position = 0
+        while position < len(chunk):
+            if self.in_image:
+                position = self.feed_image(chunk, position)
+            else:
+                self.step(chunk[position])
+                position += 1
+
+    def step(self, byte):
+        if self.in_string:
+            self.step_string(byte)
+            return
+        if byte == QUOTE and self.depth == 1 and self.key == self.field:
+            self.start_image()
+            return
+        if byte == QUOTE:
+            self.in_string = True
+            self.string.clear()
+        elif byte in OPENING:
+            self.depth += 1
+        elif byte in CLOSING:
+            self.depth -= 1
+        if byte == COLON and self.depth == 1:
+            self.key = self.pending_key
+        elif byte not in WHITESPACE:
+            self.key = None
+        self.output.append(byte)
+
+    def step_string(self, byte):
+        self.output.append(byte)
+        if self.escape:
+            self.escape = False
+        elif byte == BACKSLASH:
+            self.escape = True
+        elif byte == QUOTE:
+            self.in_string = False
+            if self.depth == 1:
+                self.pending_key = bytes(self.string)
+            return
+        if self.depth == 1:
+            self.string.append(byte)
+
+    def start_image(self):
+        self.in_image = True
+        self.key = None
+        self.output += b'null'
+        self.file = tempfile.SpooledTemporaryFile(
+            max_size=settings.RECIPE_IMAGE_SPOOL_SIZE
+        )
+
+    def feed_image(self, chunk, position):
+        end = chunk.find(b'"', position)
+        started = time.perf_counter()
+        self.write_image(chunk[position:len(chunk) if end == -1 else end])
+        if end != -1:
+            self.finish_image()
+        self.decode_time += time.perf_counter() - started
+        return len(chunk) if end == -1 else end + 1
+
+    def write_image(self, segment):
+        data = self.carry + segment
+        self.carry = b''
+        if data.endswith(b'\\'):
+            data, self.carry = data[:-1], b'\\'
+        data = data.replace(b'\\/', b'/').replace(b'\\n', b'').replace(
+            b'\\r', b''
+        )
+        if not self.header_done:
+            self.header += data
+            if DATA_URI_PREFIX.startswith(bytes(self.header)):
+                return
+            if self.header.startswith(DATA_URI_PREFIX):
+                comma = self.header.find(b',')
+                if comma == -1:
+                    if len(self.header) > 256:
+                        raise ParseError('Неверный заголовок картинки.')
+                    return
+                data = bytes(self.header[comma + 1:])
+            else:
+                data = bytes(self.header)
+            self.header_done = True
+        self.pending += data
+        self.decode(len(self.pending) - len(self.pending) % 4)
+
+    def decode(self, length):
+        try:
+            decoded = binascii.a2b_base64(bytes(self.pending[:length]))
+        except binascii.Error:
+            raise ParseError('Картинка должна быть в base64.')
+        del self.pending[:length]
+        self.size += len(decoded)
+        if self.size > settings.RECIPE_IMAGE_MAX_BYTES:
+            raise PayloadTooLarge('Картинка слишком большая.')
+        self.file.write(decoded)
+
+    def finish_image(self):
+        if not self.header_done:
+            if self.header.startswith(DATA_URI_PREFIX):
+                raise ParseError('Неверный заголовок картинки.')
+            self.pending += self.header
+            self.header_done = True
+        if len(self.pending) % 4:
+            raise ParseError('Картинка должна быть в base64.')
+        self.decode(len(self.pending))
+        self.in_image = False
+        self.file.seek(0)
+
+    def get_upload(self):
+        """Файл картинки с расширением по формату, размеры проверены."""
+        if self.file is None:
+            return None
+        extension = ''
+        try:
+            image = Image.open(self.file)
+            width, height = image.size
+            extension = IMAGE_FORMATS.get(image.format, '')
+        except Image.DecompressionBombError:
+            raise PayloadTooLarge('Слишком большое разрешение картинки.')
+        except (OSError, ValueError):
+            width = height = 0
+        if (
+            max(width, height) > settings.RECIPE_IMAGE_MAX_SIDE
+            or width * height > settings.RECIPE_IMAGE_MAX_PIXELS
+        ):
+            raise PayloadTooLarge('Слишком большое разрешение картинки.')
+        self.file.seek(0)
+        return UploadedFile(
+            file=self.file,
+            name=f'image.{extension}',
+            size=self.size,
+        )
+
+
+class RecipeJSONParser(JSONParser):
+    """
+    JSON-парсер для рецептов: картинка из поля image декодируется
+    потоково во временный файл, размер запроса и картинки ограничен.
+    """
+    image_field = 'image'
+    chunk_size = 64 * 1024
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        request = parser_context.get('request')
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        max_bytes = settings.RECIPE_REQUEST_MAX_BYTES
+        if request is not None and int(
+            request.META.get('CONTENT_LENGTH') or 0
+        ) > max_bytes:
+            raise PayloadTooLarge()
+        extractor = ImageMemberExtractor(self.image_field)
+        received = 0
+        for chunk in iter(lambda: stream.read(self.chunk_size), b''):
+            received += len(chunk)
+            if received > max_bytes:
+                raise PayloadTooLarge()
+            extractor.feed(chunk)
+        if extractor.in_image or extractor.in_string:
+            raise ParseError('JSON оборван.')
+        try:
+            data = json.loads(extractor.output.decode(encoding))
+        except ValueError as error:
+            raise ParseError(f'JSON parse error - {error}')
+        upload = extractor.get_upload()
+        if upload is not None:
+            data[self.image_field] = upload
+            logger.debug(
+                'Картинка %s байт декодирована за %.1f мс',
+                extractor.size, extractor.decode_time * 1000
+            )
+            if request is not None:
+                request.image_decode_time = extractor.decode_time
+        return data
+
+
+class NDJSONParser(BaseParser):
+    """
+    Отдаёт тело запроса построчно, не читая его целиком:
+    строки разбирает импорт рецептов.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = (parser_context or {}).get('request')
+        max_bytes = settings.RECIPE_IMPORT_MAX_BYTES
+        if request is not None and int(
+            request.META.get('CONTENT_LENGTH') or 0
+        ) > max_bytes:
+            raise PayloadTooLarge()
+        return self.lines(stream, max_bytes)
+
+    def lines(self, stream, max_bytes):
+        received = 0
+        for line in stream:
+            received += len(line)
+            if received > max_bytes:
+                raise PayloadTooLarge()
+            yield line
@@ -0,0 +1,125 @@
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
+from django.db.models import IntegerField, Value
+
+from core.versions import get_versions, shared_cache
+from recipes.models import FavoriteRecipe, Recipe, ShoppingCart
+from users.models import Follow
+from .querysets import annotate_recipes
+from .routers import primary
+
+REPRESENTATION_NAMESPACES = ('recipes', 'tags', 'ingredients', 'users')
+EMPTY_FLAGS = (frozenset(), frozenset(), frozenset())
+
+
+def representation_key(recipe_id, generation, host):
+    return f'recipe:{recipe_id}:{host}:{":".join(map(str, generation))}'
+
+
+def recipe_representations(recipe_ids, request, serializer_class):
+    """
+    Общие для всех пользователей представления рецептов с ложными
+    флагами: из кеша, недостающие строятся одной выборкой.
+    Отдаёт {id: dict}; рецептов, которых нет в базе, в ответе нет.
+    """
+    generation = get_versions(*REPRESENTATION_NAMESPACES)
+    host = request.get_host()
+    keys = {
+        recipe_id: representation_key(recipe_id, generation, host)
+        for recipe_id in recipe_ids
+    }
+    cache = shared_cache()
+    found = cache.get_many(list(keys.values()))
+    representations = {
+        recipe_id: found[key]
+        for recipe_id, key in keys.items() if key in found
+    }
+    missing = [pk for pk in recipe_ids if pk not in representations]
+    if missing:
+        recipes = annotate_recipes(
+            Recipe.objects.filter(pk__in=missing), AnonymousUser()
+        )
+        with primary():
+            built = {
+                item['id']: item
+                for item in serializer_class(
+                    recipes, many=True, context={'request': request}
+                ).data
+            }
+        cache.set_many(
+            {keys[pk]: item for pk, item in built.items()},
+            settings.RECIPE_REPRESENTATION_TIMEOUT
+        )
+        representations.update(built)
+    return representations
+
+
+def invalidate_representations(recipe_ids, request):
+    """Счётчики рецептов меняются без сигналов, сбрасываем вручную."""
+    generation = get_versions(*REPRESENTATION_NAMESPACES)
+    keys = [
+        representation_key(recipe_id, generation, request.get_host())
+        for recipe_id in recipe_ids
+    ]
+    transaction.on_commit(lambda: shared_cache().delete_many(keys))
+
+
+def user_flags_key(user_id):
+    return f'user_flags:{user_id}'
+
+
+def user_flags(user):
+    """
+    Множества id избранного, корзины и авторов из подписок.
+    Хранятся в кеше USER_FLAGS_TIMEOUT и сбрасываются при изменениях.
+    """
+    if user.is_anonymous:
+        return EMPTY_FLAGS
+    cache = shared_cache()
+    flags = cache.get(user_flags_key(user.id))
+    if flags is None:
+        with primary():
+            flags = load_user_flags(user)
+        cache.set(
+            user_flags_key(user.id), flags, settings.USER_FLAGS_TIMEOUT
+        )
+    return flags
+
+
+def load_user_flags(user):
+    """Все три множества одним UNION ALL, строки помечены номером."""
+    parts = [
+        model.objects.filter(user=user).order_by().annotate(
+            kind=Value(kind, output_field=IntegerField())
+        ).values_list(field, 'kind')
+        for kind, (model, field) in enumerate((
+            (FavoriteRecipe, 'recipe_id'),
+            (ShoppingCart, 'recipe_id'),
+            (Follow, 'author_id'),
+        ))
+    ]
+    sets = ([], [], [])
+    for pk, kind in parts[0].union(*parts[1:], all=True):
+        sets[kind].append(pk)
+    return tuple(frozenset(ids) for ids in sets)
+
+
+def invalidate_user_flags(user):
+    transaction.on_commit(
+        lambda: shared_cache().delete(user_flags_key(user.id))
+    )
+
+
+def personalize(item, flags):
+    """Копия представления рецепта с флагами пользователя."""
+    favorites, cart, followed = flags
+    return {
+        **item,
+        'is_favorited': item['id'] in favorites,
+        'is_in_shopping_cart': item['id'] in cart,
+        'author': {
+            **item['author'],
+            'is_subscribed': item['author']['id'] in followed,
+        },
+    }
@@ -0,0 +1,141 @@
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db import connection, connections, router
+from django.db.models import (
+    BooleanField, Count, Exists, F, OuterRef, Prefetch, Subquery, Value,
+    Window
+)
+from django.db.models.functions import RowNumber
+from django.db.models.sql import InsertQuery
+
+from recipes.models import (
+    AmountImgredientsInRecipe, FavoriteRecipe, Recipe, ShoppingCart
+)
+from users.models import Follow
+
+User = get_user_model()
+
+
+def false_flag():
+    return Value(False, output_field=BooleanField())
+
+
+def annotate_users(queryset, user):
+    """Добавляет пользователям флаг подписки текущего пользователя."""
+    if user.is_anonymous:
+        return queryset.annotate(is_subscribed=false_flag())
+    return queryset.annotate(is_subscribed=Exists(
+        Follow.objects.filter(user=user, author=OuterRef('pk'))
+    ))
+
+
+def annotate_recipes(queryset, user):
+    """
+    План выборки рецептов для RecipeReadSerializer:
+    флаги пользователя считаются подзапросами,
+    связанные объекты подгружаются пачкой на всю страницу.
+    """
+    if user.is_anonymous:
+        queryset = queryset.annotate(
+            is_favorited=false_flag(),
+            is_in_cart=false_flag(),
+        )
+    else:
+        queryset = queryset.annotate(
+            is_favorited=Exists(FavoriteRecipe.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+        )
+    return queryset.prefetch_related(
+        'tags',
+        Prefetch('author', queryset=annotate_users(User.objects.all(), user)),
+        Prefetch(
+            'amount_ingredient',
+            queryset=AmountImgredientsInRecipe.objects.select_related(
+                'ingredient'
+            ).order_by('ingredient__name')
+        ),
+    )
+
+
+def recent_recipes(author_ids, limit):
+    """
+    Последние рецепты авторов, не больше limit на каждого,
+    одним запросом для всей страницы подписок.
+    """
+    recipes = Recipe.objects.filter(author_id__in=author_ids)
+    if connection.features.supports_over_clause:
+        ranked = recipes.annotate(recipe_rank=Window(
+            expression=RowNumber(),
+            partition_by=[F('author_id')],
+            order_by=(F('pub_date').desc(), F('id').desc()),
+        ))
+        sql, params = ranked.query.sql_with_params()
+        return Recipe.objects.raw(
+            f'SELECT * FROM ({sql}) AS ranked WHERE recipe_rank <= %s '
+            f'ORDER BY pub_date DESC, id DESC',
+            params + (limit,)
+        )
+    return recipes.filter(pk__in=Subquery(
+        Recipe.objects.filter(
+            author_id=OuterRef('author_id')
+        ).order_by('-pub_date', '-id').values('pk')[:limit]
+    )).order_by('-pub_date', '-id')
+
+
+def subscriptions_for(user):
+    return User.objects.filter(following__user=user).annotate(
+        recipes_count=Count('recipes')
+    )
+
+
+def attach_recent_recipes(authors, limit):
+    """Раскладывает последние рецепты по авторам страницы."""
+    by_author = defaultdict(list)
+    if limit > 0 and authors:
+        for recipe in recent_recipes([author.id for author in authors], limit):
+            by_author[recipe.author_id].append(recipe)
+    for author in authors:
+        author.recent_recipes = by_author[author.id]
+    return authors
+
+
+def insert_ignore(objs, returning):
+    """
+    INSERT с пропуском строк, нарушающих уникальность, без
+    предварительной проверки. Возвращает значения поля returning
+    у реально вставленных строк.
+    """
+    if not objs:
+        return []
+    model = type(objs[0])
+    field = model._meta.get_field(returning)
+    using = router.db_for_write(model)
+    connection = connections[using]
+    fields = [
+        model_field for model_field in model._meta.local_concrete_fields
+        if model_field is not model._meta.auto_field
+    ]
+
+    def compile(rows):
+        query = InsertQuery(model, ignore_conflicts=True)
+        query.insert_values(fields, rows)
+        return query.get_compiler(using=using).as_sql()
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            (sql, params), = compile(objs)
+            column = connection.ops.quote_name(field.column)
+            cursor.execute(f'{sql} RETURNING {column}', params)
+            return [row[0] for row in cursor.fetchall()]
+        inserted = []
+        for obj in objs:
+            for sql, params in compile([obj]):
+                cursor.execute(sql, params)
+                if cursor.rowcount == 1:
+                    inserted.append(getattr(obj, field.attname))
+        return inserted
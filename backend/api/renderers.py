@@ -0,0 +1,98 @@
+import csv
+import json
+
+from django.conf import settings
+from rest_framework.renderers import BaseRenderer
+
+
+class Echo:
+    """Буфер для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingCartRenderer(BaseRenderer):
+    """
+    Базовый рендерер списка покупок.
+    Файл отдаётся по частям через stream(), render() нужен
+    только для ответов с ошибками.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+    def get_filename(self, user):
+        return f'{user.username}_shopping.{self.format}'
+
+    def stream(self, user, ingredients):
+        raise NotImplementedError
+
+
+class TextShoppingCartRenderer(ShoppingCartRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, user, ingredients):
+        yield f'{user.username}, {settings.DOWNLOAD_SHOPPING_CART}\n'
+        separator = ''
+        for ingredient in ingredients:
+            yield (
+                f'{separator}- {ingredient["ingredient__name"]} '
+                f'({ingredient["ingredient__measurement_unit"]})'
+                f' - {ingredient["amount"]}'
+            )
+            separator = '\n'
+
+
+class CSVShoppingCartRenderer(ShoppingCartRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, user, ingredients):
+        writer = csv.writer(Echo())
+        yield writer.writerow(('name', 'measurement_unit', 'amount'))
+        for ingredient in ingredients:
+            yield writer.writerow((
+                ingredient['ingredient__name'],
+                ingredient['ingredient__measurement_unit'],
+                ingredient['amount'],
+            ))
+
+
+class JSONShoppingCartRenderer(ShoppingCartRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+    def stream(self, user, ingredients):
+        yield '['
+        separator = ''
+        for ingredient in ingredients:
+            yield separator + json.dumps({
+                'name': ingredient['ingredient__name'],
+                'measurement_unit': ingredient['ingredient__measurement_unit'],
+                'amount': ingredient['amount'],
+            }, ensure_ascii=False)
+            separator = ', '
+        yield ']'
+
+
+SHOPPING_CART_RENDERERS = (
+    TextShoppingCartRenderer,
+    CSVShoppingCartRenderer,
+    JSONShoppingCartRenderer,
+)
+
+
+class PrometheusRenderer(BaseRenderer):
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, str):
+            return data.encode(self.charset)
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
@@ -0,0 +1,141 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+logger = logging.getLogger(__name__)
+
+state = threading.local()
+unhealthy = {}
+# Токены и сессии читаются до того, как пользователь известен:
+# только что выданный токен на отстающей реплике дал бы 401.
+PRIMARY_APPS = {'authtoken', 'sessions'}
+UNDECIDED = object()
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+
+
+def mark_unhealthy(alias):
+    unhealthy[alias] = time.monotonic() + settings.REPLICA_RETRY_SECONDS
+
+
+def healthy_replica():
+    """
+    Случайная доступная реплика. Упавшая реплика пропускается
+    REPLICA_RETRY_SECONDS, если доступных нет — None.
+    """
+    now = time.monotonic()
+    aliases = [
+        alias for alias in replica_aliases()
+        if unhealthy.get(alias, 0) <= now
+    ]
+    random.shuffle(aliases)
+    for alias in aliases:
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            logger.warning('Реплика %s недоступна', alias, exc_info=True)
+            mark_unhealthy(alias)
+            continue
+        return alias
+    return None
+
+
+def pin_key(user):
+    return f'replica_pin:{user.pk}'
+
+
+def pin(user):
+    """После записи пользователь какое-то время читает из основной базы."""
+    cache.set(pin_key(user), True, settings.REPLICA_PIN_SECONDS)
+
+
+def read_alias():
+    """
+    База для чтения. Реплика выбирается при первом чтении запроса:
+    к этому времени DRF уже проверил токен, и закреплённый
+    пользователь остаётся на основной базе.
+    """
+    if getattr(state, 'replica', None) is UNDECIDED:
+        state.replica = None
+        user = getattr(state.request, 'user', None)
+        pinned = (
+            user is not None and user.is_authenticated
+            and cache.get(pin_key(user))
+        )
+        state.replica = None if pinned else healthy_replica()
+    return getattr(state, 'replica', None) or DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def primary():
+    """
+    Чтения внутри блока идут в основную базу. Так строится всё,
+    что кладётся в кеш под текущей версией: реплика может отставать
+    и отдать данные старше версии.
+    """
+    replica = getattr(state, 'replica', None)
+    state.replica = None
+    try:
+        yield
+    finally:
+        state.replica = replica
+
+
+class ReplicaMiddleware:
+    """
+    Чтение в безопасных запросах отправляет на реплику. После
+    записи или входа пользователь REPLICA_PIN_SECONDS читает
+    из основной базы, чтобы сразу видеть свои изменения.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        safe = request.method in SAFE_METHODS
+        if safe and replica_aliases():
+            state.request = request
+            state.replica = UNDECIDED
+        try:
+            response = self.get_response(request)
+        finally:
+            state.request = None
+            state.replica = None
+        # DRF кладёт пользователя по токену и в исходный HttpRequest.
+        user = getattr(request, 'user', None)
+        if not safe and user is not None and user.is_authenticated:
+            pin(user)
+        return response
+
+
+class ReplicaRouter:
+    """
+    Чтение идёт на реплику, выбранную ReplicaMiddleware, запись,
+    миграции, токены и чтение внутри транзакции — в основную базу.
+    """
+
+    def db_for_read(self, model, **hints):
+        if (
+            model._meta.app_label in PRIMARY_APPS
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return read_alias()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,199 @@
+import bisect
+import re
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector, SearchVectorField
+)
+from django.db import connections
+from django.db.models import (
+    Case, F, Func, IntegerField, OuterRef, Subquery, TextField, Value,
+    When
+)
+
+from recipes.models import AmountImgredientsInRecipe, Ingredient, Recipe
+from .cache import get_latest, get_or_build
+
+WORD = re.compile(r'\w+')
+
+
+def fold(value):
+    """Приводит строку к виду для поиска: регистр и «ё»."""
+    return value.casefold().replace('ё', 'е').strip()
+
+
+class IngredientIndex:
+    """
+    Индекс ингредиентов для автодополнения: названия в сортированном
+    списке, начало слова ищется бинарным поиском.
+    """
+
+    def __init__(self, rows):
+        self.entries = sorted((fold(name), pk) for pk, name in rows)
+        self.keys = [key for key, _ in self.entries]
+
+    def search(self, query, limit):
+        """Сначала совпадения по началу названия, затем по вхождению."""
+        query = fold(query)
+        start = bisect.bisect_left(self.keys, query)
+        found = []
+        for key, pk in islice(self.entries, start, None):
+            if not key.startswith(query) or len(found) >= limit:
+                break
+            found.append(pk)
+        for key, pk in self.entries:
+            if len(found) >= limit:
+                break
+            if query in key and not key.startswith(query):
+                found.append(pk)
+        return found
+
+
+def ingredient_index():
+    return get_or_build(
+        'ingredients',
+        'index',
+        lambda: IngredientIndex(
+            Ingredient.objects.values_list('pk', 'name').iterator()
+        ),
+        shared=False
+    )
+
+
+def order_by_ids(queryset, ids):
+    """Сохраняет порядок ids, посчитанный вне базы."""
+    return queryset.filter(pk__in=ids).order_by(Case(
+        *[
+            When(pk=pk, then=Value(position))
+            for position, pk in enumerate(ids)
+        ],
+        output_field=IntegerField(),
+    ))
+
+
+def tokenize(value):
+    return WORD.findall(fold(value))
+
+
+def ingredient_names():
+    """Названия ингредиентов рецепта одной строкой, для OuterRef('pk')."""
+    return Subquery(
+        AmountImgredientsInRecipe.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            names=StringAgg('ingredient__name', ' ')
+        ).values('names'),
+        output_field=TextField()
+    )
+
+
+def update_search_vectors(queryset):
+    """
+    Пересчитывает search_vector рецептов: название (вес A),
+    ингредиенты (B) и описание (C) во всех RECIPE_SEARCH_CONFIGS.
+    На базах кроме Postgres колонка не используется.
+    """
+    if connections[queryset.db].vendor != 'postgresql':
+        return 0
+    # SearchVector с разными config нельзя сложить через +,
+    # поэтому векторы конфигураций склеиваются оператором || вручную.
+    vector = Func(
+        *(
+            SearchVector('name', weight='A', config=config)
+            + SearchVector(ingredient_names(), weight='B', config=config)
+            + SearchVector('text', weight='C', config=config)
+            for config in settings.RECIPE_SEARCH_CONFIGS
+        ),
+        template='%(expressions)s',
+        arg_joiner=' || ',
+        output_field=SearchVectorField()
+    )
+    return queryset.update(search_vector=vector)
+
+
+class RecipeSearchIndex:
+    """
+    Обратный индекс рецептов в памяти для баз без полнотекстового поиска:
+    слово -> {id рецепта: вес}, веса полей как у search_vector.
+    Все слова запроса обязательны, каждое ищется и по началу слова.
+    """
+    weights = {'name': 3, 'ingredients': 2, 'text': 1}
+
+    def __init__(self, recipes, ingredients):
+        postings = defaultdict(lambda: defaultdict(int))
+        for pk, name, text in recipes:
+            for field, value in (('name', name), ('text', text)):
+                for word in tokenize(value):
+                    postings[word][pk] += self.weights[field]
+        for pk, name in ingredients:
+            for word in tokenize(name):
+                postings[word][pk] += self.weights['ingredients']
+        self.postings = {word: dict(ids) for word, ids in postings.items()}
+        self.words = sorted(self.postings)
+
+    def match(self, word):
+        """Веса рецептов по слову и словам, которые с него начинаются."""
+        scores = defaultdict(int)
+        start = bisect.bisect_left(self.words, word)
+        for candidate in islice(self.words, start, None):
+            if not candidate.startswith(word):
+                break
+            for pk, weight in self.postings[candidate].items():
+                scores[pk] = max(scores[pk], weight)
+        return scores
+
+    def search(self, query, limit):
+        scores = None
+        for word in tokenize(query):
+            matched = self.match(word)
+            if scores is None:
+                scores = matched
+            else:
+                scores = {
+                    pk: score + matched[pk]
+                    for pk, score in scores.items() if pk in matched
+                }
+            if not scores:
+                return []
+        if scores is None:
+            return []
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+        return [pk for pk, _ in ranked[:limit]]
+
+
+def recipe_search_index():
+    return get_latest(
+        'recipes',
+        'search',
+        lambda: RecipeSearchIndex(
+            Recipe.objects.values_list('pk', 'name', 'text').iterator(),
+            AmountImgredientsInRecipe.objects.values_list(
+                'recipe_id', 'ingredient__name'
+            ).iterator()
+        )
+    )
+
+
+def search_recipes(queryset, query):
+    """
+    Полнотекстовый поиск по рецептам, сортировка по релевантности.
+    На Postgres по search_vector, иначе по индексу в памяти.
+    """
+    query = query.strip()
+    if not query:
+        return queryset
+    if connections[queryset.db].vendor == 'postgresql':
+        search_query = None
+        for config in settings.RECIPE_SEARCH_CONFIGS:
+            part = SearchQuery(query, config=config)
+            search_query = part if search_query is None else (
+                search_query | part
+            )
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=SearchRank(F('search_vector'), search_query)
+        ).order_by('-rank', '-pub_date', '-id')
+    ids = recipe_search_index().search(query, settings.RECIPE_SEARCH_LIMIT)
+    return order_by_ids(queryset, ids)
@@ -1,7 +1,9 @@
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
 from django.contrib.auth.password_validation import validate_password
 from django.db import transaction
-from django.db.models import F
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 
@@ -9,7 +11,12 @@ from recipes.models import (
     AmountImgredientsInRecipe, FavoriteRecipe, Ingredient,
     Recipe, ShoppingCart, Tag
 )
+from recipes.images import schedule_renditions, store_image
+from recipes.services import change_recipe_amounts
 from users.models import User
+from .fields import ImageRenditionsField, RecipeImageField
+from .querysets import annotate_recipes
+from .search import update_search_vectors
 
 
 class UserReadSerializer(serializers.ModelSerializer):
@@ -30,6 +37,8 @@ class UserReadSerializer(serializers.ModelSerializer):
         user = self.context.get('request').user
         if user.is_anonymous or (user == obj):
             return False
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         return user.follower.filter(author=obj).exists()
 
 
@@ -54,9 +63,11 @@ class UserWriteSerializer(serializers.ModelSerializer):
 
 
 class GetFollowerRecipeSerializer(serializers.ModelSerializer):
+    image_renditions = ImageRenditionsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_renditions', 'cooking_time')
 
 
 class UserSetPasswordSerializer(serializers.Serializer):
@@ -105,11 +116,21 @@ class FollowSerializer(UserReadSerializer):
 
     def get_recipes_count(self, obj):
         """Количество рецептов."""
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
 
     def get_recipes(self, object):
-        queryset = object.recipes.all()[:3]
-        return GetFollowerRecipeSerializer(queryset, many=True).data
+        if hasattr(object, 'recent_recipes'):
+            queryset = object.recent_recipes
+        else:
+            limit = self.context.get(
+                'recipes_limit', settings.RECIPES_LIMIT_DEFAULT
+            )
+            queryset = object.recipes.all()[:limit]
+        return GetFollowerRecipeSerializer(
+            queryset, many=True, context=self.context
+        ).data
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -138,31 +159,36 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     ingredients = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
+    image_renditions = ImageRenditionsField()
 
     class Meta:
         fields = (
             'id', 'tags', 'author', 'ingredients',
             'is_favorited', 'is_in_shopping_cart', 'name',
-            'image', 'text', 'cooking_time'
+            'image', 'image_renditions', 'text', 'cooking_time',
+            'favorites_count'
         )
         model = Recipe
 
     def get_ingredients(self, obj):
         """получаем ингредиенты."""
-        recipe = obj
-        ingredients = recipe.ingredients.values(
-            'id',
-            'name',
-            'measurement_unit',
-            amount=F('amount_ingredient__amount')
-        )
-        return ingredients
+        return [
+            {
+                'id': amount.ingredient.id,
+                'name': amount.ingredient.name,
+                'measurement_unit': amount.ingredient.measurement_unit,
+                'amount': amount.amount,
+            }
+            for amount in obj.amount_ingredient.all()
+        ]
 
     def get_is_favorited(self, obj):
         """Проверка избранного."""
         user = self.context['request'].user
         if user.is_anonymous:
             return False
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         return FavoriteRecipe.objects.filter(
             user=user, recipe__id=obj.id
         ).exists()
@@ -172,18 +198,75 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         user = self.context['request'].user
         if user.is_anonymous:
             return False
+        if hasattr(obj, 'is_in_cart'):
+            return obj.is_in_cart
         return ShoppingCart.objects.filter(
             user=user, recipe__id=obj.id
         ).exists()
 
 
+class RecipeMatchSerializer(RecipeReadSerializer):
+    matched = serializers.IntegerField(read_only=True)
+    missing = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeReadSerializer.Meta):
+        fields = RecipeReadSerializer.Meta.fields + ('matched', 'missing')
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список рецептов для массового добавления в избранное и корзину."""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=settings.RECIPE_BULK_LIMIT,
+    )
+
+    def validate_recipes(self, value):
+        recipe_ids = list(dict.fromkeys(value))
+        found = set(Recipe.objects.filter(
+            pk__in=recipe_ids
+        ).values_list('pk', flat=True))
+        missing = [pk for pk in recipe_ids if pk not in found]
+        if missing:
+            raise serializers.ValidationError(
+                f'Рецепты не найдены: {missing}'
+            )
+        return recipe_ids
+
+
+class RecipeReferences:
+    """
+    Теги и ингредиенты, на которые ссылается рецепт.
+    Неизвестные id запрашиваются одним id__in на вызов.
+    """
+
+    def __init__(self):
+        self.tags = {}
+        self.ingredient_ids = set()
+        self.checked_tags = set()
+        self.checked_ingredients = set()
+
+    def resolve_tags(self, ids):
+        unknown = set(ids) - self.checked_tags
+        if unknown:
+            self.tags.update(Tag.objects.in_bulk(unknown))
+            self.checked_tags |= unknown
+        return {pk: self.tags[pk] for pk in ids if pk in self.tags}
+
+    def resolve_ingredients(self, ids):
+        unknown = set(ids) - self.checked_ingredients
+        if unknown:
+            self.ingredient_ids.update(Ingredient.objects.filter(
+                id__in=unknown
+            ).values_list('id', flat=True))
+            self.checked_ingredients |= unknown
+        return self.ingredient_ids.intersection(ids)
+
+
 class RecipeWriteSerializer(serializers.ModelSerializer):
     ingredients = CreateIngredientInRecipeSerializer(many=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True
-    )
-    image = Base64ImageField()
+    tags = serializers.ListField(child=serializers.IntegerField())
+    image = RecipeImageField()
     author = UserWriteSerializer(read_only=True)
 
     class Meta:
@@ -194,20 +277,39 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             'cooking_time'
         )
 
-    def validate(self, data):
-        ingredients = self.initial_data.get('ingredients')
-        ingredient_list = []
-        for ingredient in ingredients:
-            ingredient_id = ingredient['id']
-            if ingredient_id in ingredient_list:
-                raise serializers.ValidationError(
-                    'Ингредиент должен быть уникальным!'
-                )
-            ingredient_list.append(ingredient_id)
-        return data
+    @property
+    def references(self):
+        return self.context.setdefault('references', RecipeReferences())
+
+    def validate_tags(self, value):
+        value = list(dict.fromkeys(value))
+        found = self.references.resolve_tags(value)
+        missing = [pk for pk in value if pk not in found]
+        if missing:
+            raise serializers.ValidationError(
+                f'Теги не найдены: {missing}'
+            )
+        return [found[pk] for pk in value]
+
+    def validate_ingredients(self, value):
+        """Ошибки возвращаются списком по позициям ингредиентов."""
+        counts = Counter(ingredient['id'] for ingredient in value)
+        found = self.references.resolve_ingredients(counts)
+        errors = []
+        for ingredient in value:
+            if ingredient['id'] not in found:
+                errors.append({'id': ['Ингредиент не найден.']})
+            elif counts[ingredient['id']] > 1:
+                errors.append({'id': ['Ингредиент должен быть уникальным!']})
+            else:
+                errors.append({})
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return value
 
-    @transaction.atomic
     def create_ingredients(self, recipe, ingredients):
+        if not ingredients:
+            return
         AmountImgredientsInRecipe.objects.bulk_create(
             [AmountImgredientsInRecipe(
                 recipe=recipe,
@@ -221,33 +323,78 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         user = self.context.get('request').user
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
+        validated_data.update(store_image(validated_data.pop('image')))
         recipe = Recipe.objects.create(
             author=user,
             **validated_data
         )
         self.create_ingredients(recipe, ingredients)
         recipe.tags.set(tags)
+        update_search_vectors(Recipe.objects.filter(pk=recipe.pk))
+        schedule_renditions(recipe)
         return recipe
 
+    def update_ingredients(self, recipe, ingredients):
+        """
+        Сравнивает состав рецепта с присланным: удаляются, обновляются
+        и добавляются только изменившиеся строки.
+        Возвращает старое и новое количество по ингредиентам.
+        """
+        existing = {
+            amount.ingredient_id: amount
+            for amount in recipe.amount_ingredient.all()
+        }
+        submitted = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        old_amounts = Counter({
+            ingredient_id: amount.amount
+            for ingredient_id, amount in existing.items()
+        })
+        removed = set(existing) - set(submitted)
+        if removed:
+            AmountImgredientsInRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        changed = []
+        for ingredient_id, amount in submitted.items():
+            row = existing.get(ingredient_id)
+            if row is not None and row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        if changed:
+            AmountImgredientsInRecipe.objects.bulk_update(changed, ['amount'])
+        self.create_ingredients(recipe, [
+            ingredient for ingredient in ingredients
+            if ingredient['id'] not in existing
+        ])
+        return old_amounts, Counter(submitted)
+
     @transaction.atomic
     def update(self, instance, validated_data):
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        if 'image' in validated_data:
+            validated_data.update(store_image(validated_data.pop('image')))
         instance = super().update(instance, validated_data)
-        instance.tags.clear()
-        instance.tags.set(tags)
-        instance.ingredients.clear()
-        self.create_ingredients(
-            recipe=instance,
-            ingredients=ingredients
-        )
-        instance.save()
+        if tags is not None:
+            instance.tags.set(tags)
+        if ingredients is not None:
+            change_recipe_amounts(
+                instance, *self.update_ingredients(instance, ingredients)
+            )
+        update_search_vectors(Recipe.objects.filter(pk=instance.pk))
+        schedule_renditions(instance)
         return instance
 
     def to_representation(self, instance):
+        """Рецепт перечитывается с планом выборки RecipeReadSerializer."""
+        request = self.context.get('request')
+        user = request.user if request is not None else AnonymousUser()
+        recipe = annotate_recipes(
+            Recipe.objects.filter(pk=instance.pk), user
+        ).get()
         return RecipeReadSerializer(
-            instance,
-            context={
-                'request': self.context.get('request')
-            }
+            recipe, context={'request': request}
         ).data
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.versions import bump_version_on_commit
+from recipes.models import (
+    AmountImgredientsInRecipe, Ingredient, Recipe, Tag
+)
+
+from .routers import pin
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    bump_version_on_commit('tags')
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients(sender, **kwargs):
+    bump_version_on_commit('ingredients')
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=AmountImgredientsInRecipe)
+def invalidate_recipes(sender, **kwargs):
+    bump_version_on_commit('recipes')
+
+
+@receiver((post_save, post_delete), sender=settings.AUTH_USER_MODEL)
+def invalidate_users(sender, created=False, update_fields=None, **kwargs):
+    """
+    Нового пользователя ещё нет ни в одном ответе, а вход меняет
+    только last_login, которого в ответах нет.
+    """
+    if created:
+        return
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    bump_version_on_commit('users')
+
+
+@receiver(user_logged_in)
+def pin_logged_in(sender, user, **kwargs):
+    """Запрос входа идёт без токена, закрепляем пользователя здесь."""
+    pin(user)
@@ -0,0 +1,227 @@
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from rest_framework import serializers
+
+from core.versions import bump_version_on_commit
+from recipes.models import AmountImgredientsInRecipe, Ingredient, Recipe, Tag
+from .search import update_search_vectors
+
+
+class IngredientImportSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=200)
+    measurement_unit = serializers.CharField(max_length=200)
+    amount = serializers.IntegerField(
+        min_value=settings.MINIMUM_INGREDIENT_IN_RECIPE,
+        max_value=32767
+    )
+
+
+class RecipeImportSerializer(serializers.Serializer):
+    """Строка NDJSON: теги по slug, ингредиенты по названию и единице."""
+    name = serializers.CharField(max_length=200)
+    text = serializers.CharField()
+    cooking_time = serializers.IntegerField(
+        min_value=settings.MINIMUN_COOKING_TIME
+    )
+    image = serializers.CharField(max_length=100)
+    pub_date = serializers.DateTimeField(required=False)
+    tags = serializers.ListField(child=serializers.SlugField())
+    ingredients = IngredientImportSerializer(many=True)
+
+
+def iter_ndjson(lines):
+    """(номер строки, объект или None, ошибка) по строкам NDJSON."""
+    for number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line), None
+        except ValueError as error:
+            yield number, None, f'JSON: {error}'
+
+
+class RecipeImporter:
+    """
+    Загружает рецепты пачками: рецепты, их ингредиенты и теги
+    вставляются тремя bulk_create на пачку. Ссылки на теги и
+    ингредиенты разрешаются одним запросом на пачку.
+    keep_pub_date переносит даты из файла одним bulk_update
+    после вставки: при создании pub_date ставит auto_now_add.
+    """
+
+    def __init__(self, author, batch_size=None, keep_pub_date=False,
+                 dry_run=False, max_errors=100):
+        self.author = author
+        self.batch_size = batch_size or settings.RECIPE_IMPORT_BATCH_SIZE
+        self.keep_pub_date = keep_pub_date
+        self.dry_run = dry_run
+        self.max_errors = max_errors
+        self.tags = dict(Tag.objects.values_list('slug', 'id'))
+        self.ingredients = {}
+        self.checked_names = set()
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, line, errors):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def resolve_ingredients(self, records):
+        names = {
+            ingredient['name']
+            for _, record in records for ingredient in record['ingredients']
+        } - self.checked_names
+        if names:
+            self.checked_names |= names
+            rows = Ingredient.objects.filter(name__in=names).values_list(
+                'name', 'measurement_unit', 'id'
+            )
+            for name, unit, pk in rows:
+                self.ingredients[name, unit] = pk
+
+    def check_references(self, record):
+        errors = {}
+        missing_tags = [
+            slug for slug in record['tags'] if slug not in self.tags
+        ]
+        if missing_tags:
+            errors['tags'] = [f'Теги не найдены: {missing_tags}']
+        seen = set()
+        ingredient_errors = []
+        for ingredient in record['ingredients']:
+            key = ingredient['name'], ingredient['measurement_unit']
+            if key not in self.ingredients:
+                ingredient_errors.append({'name': ['Ингредиент не найден.']})
+            elif key in seen:
+                ingredient_errors.append(
+                    {'name': ['Ингредиент должен быть уникальным!']}
+                )
+            else:
+                ingredient_errors.append({})
+            seen.add(key)
+        if any(ingredient_errors):
+            errors['ingredients'] = ingredient_errors
+        return errors
+
+    def validate(self, rows):
+        records = []
+        for line, data, error in rows:
+            if error:
+                self.error(line, {'non_field_errors': [error]})
+                continue
+            serializer = RecipeImportSerializer(data=data)
+            if not serializer.is_valid():
+                self.error(line, serializer.errors)
+                continue
+            records.append((line, serializer.validated_data))
+        self.resolve_ingredients(records)
+        valid = []
+        for line, record in records:
+            errors = self.check_references(record)
+            if errors:
+                self.error(line, errors)
+            else:
+                valid.append(record)
+        return valid
+
+    def create_recipes(self, recipes):
+        """bulk_create, если база возвращает id, иначе по одному."""
+        connection = connections[router.db_for_write(Recipe)]
+        if connection.features.can_return_ids_from_bulk_insert:
+            return Recipe.objects.bulk_create(recipes)
+        for recipe in recipes:
+            recipe.save(force_insert=True)
+        return recipes
+
+    @transaction.atomic
+    def save(self, records):
+        recipes = self.create_recipes([
+            Recipe(
+                author=self.author,
+                name=record['name'],
+                text=record['text'],
+                cooking_time=record['cooking_time'],
+                image=record['image'],
+            )
+            for record in records
+        ])
+        if self.keep_pub_date:
+            dated = []
+            for recipe, record in zip(recipes, records):
+                if 'pub_date' in record:
+                    recipe.pub_date = record['pub_date']
+                    dated.append(recipe)
+            Recipe.objects.bulk_update(dated, ['pub_date'])
+        AmountImgredientsInRecipe.objects.bulk_create([
+            AmountImgredientsInRecipe(
+                recipe=recipe,
+                ingredient_id=self.ingredients[
+                    ingredient['name'], ingredient['measurement_unit']
+                ],
+                amount=ingredient['amount'],
+            )
+            for recipe, record in zip(recipes, records)
+            for ingredient in record['ingredients']
+        ])
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe=recipe, tag_id=self.tags[slug])
+            for recipe, record in zip(recipes, records)
+            for slug in dict.fromkeys(record['tags'])
+        ])
+        update_search_vectors(
+            Recipe.objects.filter(pk__in=[recipe.pk for recipe in recipes])
+        )
+        bump_version_on_commit('recipes')
+
+    def load_batch(self, rows):
+        records = self.validate(rows)
+        if records and not self.dry_run:
+            self.save(records)
+        self.created += len(records)
+
+    def load(self, lines):
+        """Загружает строки NDJSON, отдаёт число рецептов после пачки."""
+        rows = iter_ndjson(lines)
+        batch = list(islice(rows, self.batch_size))
+        while batch:
+            self.load_batch(batch)
+            yield self.created
+            batch = list(islice(rows, self.batch_size))
+
+
+def export_recipes(queryset, batch_size=None):
+    """Строки NDJSON с рецептами, пачками по первичному ключу."""
+    batch_size = batch_size or settings.RECIPE_IMPORT_BATCH_SIZE
+    queryset = queryset.order_by('pk').prefetch_related(
+        'tags', 'amount_ingredient__ingredient'
+    )
+    last = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last)[:batch_size])
+        if not batch:
+            return
+        for recipe in batch:
+            yield json.dumps({
+                'name': recipe.name,
+                'text': recipe.text,
+                'cooking_time': recipe.cooking_time,
+                'image': recipe.image.name,
+                'pub_date': recipe.pub_date.isoformat(),
+                'tags': [tag.slug for tag in recipe.tags.all()],
+                'ingredients': [
+                    {
+                        'name': amount.ingredient.name,
+                        'measurement_unit': amount.ingredient.measurement_unit,
+                        'amount': amount.amount,
+                    }
+                    for amount in recipe.amount_ingredient.all()
+                ],
+            }, ensure_ascii=False) + '\n'
+        last = batch[-1].pk
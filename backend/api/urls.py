@@ -1,7 +1,9 @@
 from django.urls import include, path
 from rest_framework.routers import SimpleRouter
 
-from .views import IngredientViewSet, RecipeViewSet, TagViewSet, UsersViewSet
+from .views import (
+    IngredientViewSet, MetricsView, RecipeViewSet, TagViewSet, UsersViewSet
+)
 
 app_name = 'api'
 
@@ -15,4 +17,5 @@ router.register(r'users', UsersViewSet, basename='users')
 urlpatterns = [
     path('', include(router.urls)),
     path(r'auth/', include('djoser.urls.authtoken')),
+    path('_metrics/', MetricsView.as_view(), name='metrics'),
 ]
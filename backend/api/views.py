@@ -2,33 +2,64 @@ from django_filters.rest_framework import DjangoFilterBackend
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import F
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
 from .paginators import CustomPageNumberPaginator
+from .parsers import NDJSONParser, RecipeJSONParser
 from users.models import Follow
 from api.serializers import (
     IngredientSerializer, RecipeWriteSerializer, FollowSerializer,
     UserReadSerializer, RecipeReadSerializer, TagSerializer,
-    UserWriteSerializer, GetFollowerRecipeSerializer, UserSetPasswordSerializer
+    UserWriteSerializer, GetFollowerRecipeSerializer,
+    UserSetPasswordSerializer, RecipeMatchSerializer, RecipeIdsSerializer
 )
 from .filters import RecipeFilter, IngredientFilter
+from .matching import ingredient_match_index
 from .permissions import IsAdminOrAuthorOrReadOnly
-from .mixins import ListRetrieveViewSet
+from .personalization import invalidate_representations, invalidate_user_flags
+from .metrics import prometheus_metrics
+from .renderers import PrometheusRenderer, SHOPPING_CART_RENDERERS
+from .search import order_by_ids
+from .transfer import RecipeImporter
+from .querysets import (
+    annotate_recipes, annotate_users, attach_recent_recipes, insert_ignore,
+    subscriptions_for
+)
+from .mixins import (
+    AnonymousResponseCacheMixin, CachedReferenceMixin, ListRetrieveViewSet,
+    PersonalizedRecipeMixin
+)
 from recipes.models import (
-    FavoriteRecipe, AmountImgredientsInRecipe, Ingredient,
-    Recipe, ShoppingCart, Tag
+    FavoriteRecipe, Ingredient, Recipe, ShoppingCart, ShoppingListItem, Tag
+)
+from recipes.recommendations import mark_stale, recommended_ids
+from recipes.services import (
+    add_to_shopping_list, change_counter, remove_from_shopping_list
 )
 
 User = get_user_model()
 
 
+class MetricsView(APIView):
+    """Метрики запросов из буфера в формате Prometheus."""
+    permission_classes = (permissions.IsAdminUser,)
+    renderer_classes = (PrometheusRenderer,)
+
+    def get(self, request):
+        return Response(prometheus_metrics())
+
+
 class FollowViewSet(viewsets.ModelViewSet):
     """Вьюха для подписок."""
     serializer_class = FollowSerializer
@@ -42,6 +73,7 @@ class FollowViewSet(viewsets.ModelViewSet):
 class UsersViewSet(UserViewSet):
     """Вьюха для юзеров."""
     pagination_class = CustomPageNumberPaginator
+    cursor_ordering = ('username', 'id')
     permission_classes = (IsAuthenticated,)
 
     def get_serializer_class(self):
@@ -55,7 +87,7 @@ class UsersViewSet(UserViewSet):
             serializer.save(password=password)
 
     def get_queryset(self):
-        return User.objects.all()
+        return annotate_users(User.objects.all(), self.request.user)
 
     @action(
         detail=False,
@@ -76,13 +108,25 @@ class UsersViewSet(UserViewSet):
             status=status.HTTP_201_CREATED
         )
 
+    def get_recipes_limit(self):
+        try:
+            limit = int(self.request.query_params['recipes_limit'])
+        except (KeyError, ValueError):
+            return settings.RECIPES_LIMIT_DEFAULT
+        return max(limit, 0)
+
     @action(detail=False, permission_classes=(IsAuthenticated,))
     def subscriptions(self, request):
         """Метод выводит подписки пользователя."""
-        pages = self.paginate_queryset(
-            User.objects.filter(following__user=request.user)
+        limit = self.get_recipes_limit()
+        pages = attach_recent_recipes(
+            self.paginate_queryset(subscriptions_for(request.user)), limit
+        )
+        serializer = FollowSerializer(
+            pages,
+            many=True,
+            context={**self.get_serializer_context(), 'recipes_limit': limit}
         )
-        serializer = FollowSerializer(pages, many=True)
         return self.get_paginated_response(serializer.data)
 
     @action(
@@ -97,32 +141,25 @@ class UsersViewSet(UserViewSet):
         author = self.get_object()
 
         if request.method == 'POST':
-            follow_obj_filter = Follow.objects.filter(
-                user=user,
-                author=author
-            ).exists()
-
             if user == author:
                 return Response(
                     {'message': settings.YOU_CANT_SUBSCRIBE_TO_YOURSELF},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-
-            elif follow_obj_filter:
+            if not insert_ignore([Follow(user=user, author=author)], 'author'):
                 return Response(
                     {'message': settings.YOU_ALREADY_SIGNED_UP},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-
-            Follow.objects.create(user=user, author=author)
+            invalidate_user_flags(user)
             return Response(
                 {'message': settings.YOU_HAVE_SUCCESSFULLY_SUBSCRIBED},
                 status=status.HTTP_201_CREATED
             )
 
-        follow = Follow.objects.filter(user=user, author=author).exists()
-        if follow:
-            get_object_or_404(Follow, user=user, author=author).delete()
+        deleted, _ = Follow.objects.filter(user=user, author=author).delete()
+        if deleted:
+            invalidate_user_flags(user)
             return Response(
                 {'message': settings.YOU_HAVE_SUCCESSFULY_UNSUBCRIBED},
                 status=status.HTTP_204_NO_CONTENT
@@ -133,26 +170,32 @@ class UsersViewSet(UserViewSet):
         )
 
 
-class TagViewSet(ListRetrieveViewSet):
+class TagViewSet(CachedReferenceMixin, ListRetrieveViewSet):
     """Вьюха для тегов."""
+    cache_namespace = 'tags'
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
 
 
-class IngredientViewSet(ListRetrieveViewSet):
+class IngredientViewSet(CachedReferenceMixin, ListRetrieveViewSet):
     """Вьюха для ингредиентов."""
+    cache_namespace = 'ingredients'
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
     filter_backends = (IngredientFilter,)
-    search_fields = ('^name',)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+    AnonymousResponseCacheMixin,
+    PersonalizedRecipeMixin,
+    viewsets.ModelViewSet
+):
     """Вьюха для рецептов."""
-    queryset = Recipe.objects.all()
     pagination_class = CustomPageNumberPaginator
+    cursor_ordering = ('-pub_date', '-id')
+    parser_classes = (RecipeJSONParser, FormParser, MultiPartParser)
     filterset_class = RecipeFilter
     permission_classes = [IsAdminOrAuthorOrReadOnly]
     filter_backends = (DjangoFilterBackend,)
@@ -162,23 +205,88 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return RecipeReadSerializer
         return RecipeWriteSerializer
 
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        decode_time = getattr(request, 'image_decode_time', None)
+        if decode_time is not None:
+            response['Server-Timing'] = (
+                f'image-decode;dur={decode_time * 1000:.1f}'
+            )
+        return response
+
+    def get_queryset(self):
+        queryset = Recipe.objects.all()
+        if self.request.method in permissions.SAFE_METHODS:
+            return annotate_recipes(queryset, self.request.user)
+        return queryset
+
+    @transaction.atomic
+    def add_recipes(self, model, user, recipe_ids):
+        """Добавляет рецепты одним INSERT, возвращает реально добавленные."""
+        added = insert_ignore(
+            [model(user=user, recipe_id=pk) for pk in recipe_ids], 'recipe'
+        )
+        if added:
+            change_counter(model, added, 1)
+            mark_stale(added)
+            invalidate_user_flags(user)
+            invalidate_representations(added, self.request)
+            if model is ShoppingCart:
+                add_to_shopping_list(user, added)
+        return added
+
+    @transaction.atomic
+    def remove_recipes(self, model, user, recipe_ids):
+        """Удаляет рецепты, строки блокируются до конца транзакции."""
+        removed = list(model.objects.select_for_update().filter(
+            user=user, recipe_id__in=recipe_ids
+        ).values_list('recipe_id', flat=True))
+        if removed:
+            model.objects.filter(user=user, recipe_id__in=removed).delete()
+            self.release_recipes(model, user, removed)
+        return removed
+
+    def release_recipes(self, model, user, recipe_ids):
+        change_counter(model, recipe_ids, -1)
+        mark_stale(recipe_ids)
+        invalidate_user_flags(user)
+        invalidate_representations(recipe_ids, self.request)
+        if model is ShoppingCart:
+            remove_from_shopping_list(user, recipe_ids)
+
     def add_recipe(self, model, request, pk):
         recipe = get_object_or_404(Recipe, id=pk)
-        models = model.objects.filter(user=request.user, recipe=recipe)
-        if models.exists():
+        if not self.add_recipes(model, request.user, [recipe.id]):
             return Response(status=status.HTTP_400_BAD_REQUEST)
-        model(user=request.user, recipe=recipe).save()
         serializer = GetFollowerRecipeSerializer(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @transaction.atomic
     def delete_recipe(self, model, request, pk):
-        recipe = get_object_or_404(Recipe, id=pk)
-        models = model.objects.filter(user=request.user, recipe=recipe)
-        if models.exists():
-            models.delete()
+        deleted, _ = model.objects.filter(
+            user=request.user, recipe_id=pk
+        ).delete()
+        if deleted:
+            self.release_recipes(model, request.user, [int(pk)])
             return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(Recipe, id=pk)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
+    def bulk_recipes(self, model, request):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        if request.method == 'DELETE':
+            self.remove_recipes(model, request.user, recipe_ids)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        self.add_recipes(model, request.user, recipe_ids)
+        serializer = GetFollowerRecipeSerializer(
+            Recipe.objects.filter(pk__in=recipe_ids), many=True
+        )
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
     @action(
         detail=True,
         methods=['POST', 'DELETE'],
@@ -195,6 +303,17 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 FavoriteRecipe, request, kwargs.get('pk')
             )
 
+    @action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        url_path='favorite',
+        url_name='favorite-bulk',
+        permission_classes=[permissions.IsAuthenticated]
+    )
+    def favorite_bulk(self, request):
+        """Метод добавляет или удаляет несколько рецептов в избранном."""
+        return self.bulk_recipes(FavoriteRecipe, request)
+
     @action(
         detail=True,
         methods=['POST', 'DELETE'],
@@ -207,26 +326,121 @@ class RecipeViewSet(viewsets.ModelViewSet):
         if request.method == 'DELETE':
             return self.delete_recipe(ShoppingCart, request, kwargs.get('pk'))
 
-    @action(detail=False, permission_classes=[permissions.IsAuthenticated])
+    @action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        url_path='shopping_cart',
+        url_name='shopping_cart-bulk',
+        permission_classes=[permissions.IsAuthenticated]
+    )
+    def shopping_cart_bulk(self, request):
+        """Метод добавляет или удаляет несколько рецептов в корзине."""
+        return self.bulk_recipes(ShoppingCart, request)
+
+    @action(
+        detail=False,
+        methods=['POST'],
+        url_path='import',
+        url_name='import',
+        parser_classes=(NDJSONParser,),
+        permission_classes=[permissions.IsAdminUser],
+    )
+    def import_recipes(self, request):
+        """Метод загружает рецепты из NDJSON от имени пользователя."""
+        importer = RecipeImporter(request.user)
+        for _ in importer.load(request.data):
+            pass
+        return Response(
+            {
+                'created': importer.created,
+                'failed': importer.failed,
+                'errors': importer.errors,
+            },
+            status=(
+                status.HTTP_201_CREATED if importer.created
+                else status.HTTP_400_BAD_REQUEST
+            )
+        )
+
+    @action(
+        detail=False,
+        methods=['GET'],
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def recommended(self, request):
+        """Метод выводит рецепты, похожие на избранное и корзину."""
+        ids = recommended_ids(
+            request.user,
+            self.get_top_limit(settings.RECOMMENDATIONS_LIMIT)
+        )
+        serializer = RecipeReadSerializer(
+            order_by_ids(self.get_queryset(), ids),
+            many=True,
+            context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
+    def get_match_params(self):
+        try:
+            ingredients = [
+                int(pk)
+                for value in self.request.query_params.getlist('ingredients')
+                for pk in value.split(',') if pk.strip()
+            ]
+        except ValueError:
+            raise ValidationError(
+                {'ingredients': 'Укажите id ингредиентов через запятую.'}
+            )
+        if not ingredients:
+            raise ValidationError({'ingredients': 'Обязательный параметр.'})
+        return ingredients, self.get_top_limit(settings.RECIPE_MATCH_LIMIT)
+
+    def get_top_limit(self, default):
+        try:
+            limit = int(self.request.query_params['limit'])
+        except (KeyError, ValueError):
+            limit = default
+        return min(max(limit, 1), settings.RECIPE_TOP_MAX_LIMIT)
+
+    @action(detail=False, methods=['GET'])
+    def match(self, request):
+        """Метод подбирает рецепты по имеющимся ингредиентам."""
+        ingredients, limit = self.get_match_params()
+        matches = {
+            recipe_id: (matched, missing)
+            for recipe_id, matched, missing in ingredient_match_index().match(
+                ingredients, limit
+            )
+        }
+        recipes = list(order_by_ids(self.get_queryset(), list(matches)))
+        for recipe in recipes:
+            recipe.matched, recipe.missing = matches[recipe.id]
+        serializer = RecipeMatchSerializer(
+            recipes, many=True, context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
+    @action(
+        detail=False,
+        permission_classes=[permissions.IsAuthenticated],
+        renderer_classes=SHOPPING_CART_RENDERERS,
+    )
     def download_shopping_cart(self, request):
         """ Метод скачивает корзину покупок."""
-        ingredients = AmountImgredientsInRecipe.objects.filter(
-            recipe__is_in_shopping_cart__user=request.user
+        ingredients = ShoppingListItem.objects.filter(
+            user=request.user
         ).values(
             'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount')).order_by('amount')
-
-        shopping = (
-            f'{request.user.username}, {settings.DOWNLOAD_SHOPPING_CART}\n'
+            'ingredient__measurement_unit',
+            amount=F('total_amount')
+        ).order_by('total_amount').iterator(
+            chunk_size=settings.SHOPPING_CART_CHUNK_SIZE
+        )
+        renderer = request.accepted_renderer
+        filename = renderer.get_filename(request.user)
+        response = StreamingHttpResponse(
+            renderer.stream(request.user, ingredients),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}'
         )
-        shopping += '\n'.join([
-            f'- {ingredient["ingredient__name"]} '
-            f'({ingredient["ingredient__measurement_unit"]})'
-            f' - {ingredient["amount"]}'
-            for ingredient in ingredients
-        ])
-        filename = f'{request.user.username}_shopping.txt'
-        response = HttpResponse(shopping, content_type='text/plain')
         response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
@@ -0,0 +1,47 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+def shared_cache():
+    return caches[settings.REFERENCE_CACHE_ALIAS]
+
+
+def version_key(namespace):
+    return f'version:{namespace}'
+
+
+def get_version(namespace):
+    """
+    Текущая версия пространства ключей. Начальное значение берётся
+    от времени, чтобы после очистки общего кеша версии не повторялись.
+    """
+    cache = shared_cache()
+    version = cache.get(version_key(namespace))
+    if version is None:
+        cache.add(version_key(namespace), int(time.time() * 1000), None)
+        version = cache.get(version_key(namespace))
+    return version
+
+
+def bump_version(namespace):
+    cache = shared_cache()
+    try:
+        cache.incr(version_key(namespace))
+    except ValueError:
+        cache.set(version_key(namespace), int(time.time() * 1000), None)
+
+
+def bump_version_on_commit(namespace):
+    transaction.on_commit(lambda: bump_version(namespace))
+
+
+def get_versions(*namespaces):
+    """Версии нескольких пространств одним запросом к кешу."""
+    found = shared_cache().get_many([version_key(name) for name in namespaces])
+    return tuple(
+        found.get(version_key(name)) or get_version(name)
+        for name in namespaces
+    )
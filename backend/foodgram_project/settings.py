@@ -43,17 +43,34 @@ REST_FRAMEWORK = {
 }
 
 MIDDLEWARE = [
+    'api.metrics.QueryMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.routers.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram_project.urls'
 
+METRICS_BUFFER_SIZE = 10000
+METRICS_DUPLICATE_THRESHOLD = 10
+METRICS_HEADERS = bool(DEBUG)
+QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', default='') == 'True'
+QUERY_BUDGETS = {
+    # Холодный путь: токен, COUNT, id страницы, 4 на представления,
+    # флаги пользователя; карта тегов и индекс поиска в памяти ещё 3.
+    'RecipeViewSet.list': 11,
+    'RecipeViewSet.retrieve': 8,
+    'UsersViewSet.subscriptions': 6,
+    'RecipeViewSet.download_shopping_cart': 3,
+    'TagViewSet.list': 2,
+    'IngredientViewSet.list': 3,
+}
+
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 
 TEMPLATES = [
@@ -85,6 +102,68 @@ DATABASES = {
     }
 }
 
+# Реплики через запятую: host[:port] для Postgres, путь к файлу для SQLite.
+DB_REPLICAS = [
+    replica.strip()
+    for replica in os.getenv('DB_REPLICAS', default='').split(',')
+    if replica.strip()
+]
+for index, replica in enumerate(DB_REPLICAS):
+    if DATABASES['default']['ENGINE'].endswith('sqlite3'):
+        location = {'NAME': replica}
+    else:
+        host, _, port = replica.partition(':')
+        location = {'HOST': host, 'PORT': port or DATABASES['default']['PORT']}
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        **location,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['api.routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', default=5))
+REPLICA_RETRY_SECONDS = 30
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    }
+}
+
+REFERENCE_CACHE_ALIAS = 'default'
+REFERENCE_CACHE_LOCAL_SIZE = 256
+REFERENCE_CACHE_TIMEOUT = 60 * 60
+
+RESPONSE_CACHE_FRESH = 30
+RESPONSE_CACHE_STALE = 300
+RESPONSE_CACHE_LOCK_TIMEOUT = 10
+RECIPE_REPRESENTATION_TIMEOUT = 60 * 60
+USER_FLAGS_TIMEOUT = 60
+
+PAGINATION_COUNT_MODE = os.getenv('PAGINATION_COUNT_MODE', default='exact')
+PAGINATION_COUNT_CACHE_TIMEOUT = 60
+
+INGREDIENT_SEARCH_BACKEND = os.getenv(
+    'INGREDIENT_SEARCH_BACKEND', default='memory'
+)
+INGREDIENT_SEARCH_LIMIT = 30
+RECIPE_SEARCH_CONFIGS = ('russian', 'english')
+RECIPE_SEARCH_LIMIT = 1000
+RECIPE_MATCH_LIMIT = 20
+RECIPE_TOP_MAX_LIMIT = 100
+RECIPE_BULK_LIMIT = 100
+RECIPE_IMPORT_BATCH_SIZE = 1000
+RECIPE_IMPORT_MAX_BYTES = 256 * 1024 * 1024
+
+RECOMMENDATIONS_TOP_K = 20
+RECOMMENDATIONS_BATCH_SIZE = 1000
+RECOMMENDATIONS_HISTORY = 50
+RECOMMENDATIONS_LIMIT = 20
+
 AUTH_USER_MODEL = 'users.User'
 
 
@@ -126,11 +205,29 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 MINIMUN_COOKING_TIME = 1
 MINIMUM_INGREDIENT_IN_RECIPE = 1
+RECIPES_LIMIT_DEFAULT = 3
 
 DJANGORESIZED_DEFAULT_SIZE = 500, 500
 DJANGORESIZED_DEFAULT_KEEP_META = True
 DJANGORESIZED_DEFAULT_FORCE_FORMAT = "JPEG"
 
+RECIPE_IMAGE_RENDITIONS = {
+    'thumbnail': (160, 160),
+    'card': (320, 320),
+    'full': DJANGORESIZED_DEFAULT_SIZE,
+}
+RECIPE_IMAGE_FORMATS = (DJANGORESIZED_DEFAULT_FORCE_FORMAT, 'WEBP')
+RECIPE_IMAGE_QUALITY = 85
+RECIPE_REQUEST_MAX_BYTES = 16 * 1024 * 1024
+RECIPE_IMAGE_MAX_BYTES = 10 * 1024 * 1024
+RECIPE_IMAGE_MAX_SIDE = 8000
+RECIPE_IMAGE_MAX_PIXELS = 40_000_000
+RECIPE_IMAGE_SPOOL_SIZE = 1024 * 1024
+IMAGE_PIPELINE_WORKERS = int(os.getenv('IMAGE_PIPELINE_WORKERS', default=2))
+IMAGE_PIPELINE_SYNC = os.getenv('IMAGE_PIPELINE_SYNC', default='') == 'True'
+
+SHOPPING_CART_CHUNK_SIZE = 500
+
 DOWNLOAD_SHOPPING_CART = 'Вот ваш список покупок:'
 RECIPE_DELETE = 'рецепт успешно удалён'
 METHOD_NOT_ALLOWED = 'метод не разрешен'
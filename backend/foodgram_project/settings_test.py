@@ -0,0 +1,21 @@
+import os
+
+from .settings import *  # noqa: F401, F403
+from .settings import BASE_DIR
+
+# Без DB_ENGINE тесты идут на SQLite, с ним — на заданной базе.
+# Реплика-зеркало нужна, чтобы проверять, куда уходят чтения.
+if 'DB_ENGINE' not in os.environ:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': str(BASE_DIR / 'test.sqlite3'),
+        },
+        'replica_0': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': str(BASE_DIR / 'test.sqlite3'),
+            'TEST': {'MIRROR': 'default'},
+        },
+    }
+
+IMAGE_PIPELINE_SYNC = True
@@ -46,6 +46,8 @@ class RecipeAdmin(admin.ModelAdmin):
         'text',
         'cooking_time',
         'pub_date',
+        'favorites_count',
+        'cart_count',
     )
     search_fields = ('name', 'author', 'tag')
     list_filter = ('name',)
@@ -0,0 +1,138 @@
+import hashlib
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image
+
+from core.versions import bump_version_on_commit
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+ORIGINALS_DIR = Recipe._meta.get_field('image').upload_to
+RENDITIONS_DIR = f'{ORIGINALS_DIR}renditions/'
+EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp'}
+
+_executor = None
+
+
+def content_hash(file):
+    """sha256 содержимого файла, читается по частям."""
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(64 * 1024), b''):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def store_image(upload):
+    """
+    Сохраняет оригинал под именем из хеша содержимого: одинаковые
+    картинки хранятся один раз. Возвращает поля для Recipe.
+    """
+    image_hash = content_hash(upload)
+    extension = upload.name.rsplit('.', 1)[-1].lower()
+    name = f'{ORIGINALS_DIR}{image_hash}.{extension}'
+    if not default_storage.exists(name):
+        name = default_storage.save(name, upload)
+    return {
+        'image': name,
+        'image_hash': image_hash,
+        'renditions_ready': Recipe.objects.filter(
+            image_hash=image_hash, renditions_ready=True
+        ).exists(),
+    }
+
+
+def rendition_name(image_hash, rendition, image_format):
+    extension = EXTENSIONS[image_format]
+    return f'{RENDITIONS_DIR}{image_hash}/{rendition}.{extension}'
+
+
+def make_renditions(image_hash, source_name):
+    """Уменьшенные копии картинки во всех размерах и форматах."""
+    with default_storage.open(source_name) as source:
+        image = Image.open(source)
+        image.load()
+    exif = image.info.get('exif')
+    if image.mode != 'RGB':
+        background = Image.new('RGB', image.size, 'white')
+        rgba = image.convert('RGBA')
+        background.paste(rgba, mask=rgba.split()[-1])
+        image = background
+    for rendition, size in settings.RECIPE_IMAGE_RENDITIONS.items():
+        resized = image.copy()
+        resized.thumbnail(size, Image.LANCZOS)
+        for image_format in settings.RECIPE_IMAGE_FORMATS:
+            options = {'quality': settings.RECIPE_IMAGE_QUALITY}
+            if (
+                image_format == 'JPEG' and exif
+                and settings.DJANGORESIZED_DEFAULT_KEEP_META
+            ):
+                options['exif'] = exif
+            buffer = io.BytesIO()
+            resized.save(buffer, image_format, **options)
+            name = rendition_name(image_hash, rendition, image_format)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            default_storage.save(name, ContentFile(buffer.getvalue()))
+    # update() не шлёт сигналов: кеши с image_renditions сбрасываются вручную.
+    if Recipe.objects.filter(image_hash=image_hash).update(
+        renditions_ready=True
+    ):
+        bump_version_on_commit('recipes')
+
+
+def run_renditions(image_hash, source_name):
+    try:
+        make_renditions(image_hash, source_name)
+    except Exception:
+        logger.exception('Не удалось обработать картинку %s', source_name)
+    finally:
+        connection.close()
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_PIPELINE_WORKERS,
+            thread_name_prefix='renditions',
+        )
+    return _executor
+
+
+def schedule_renditions(recipe):
+    """Ставит обработку картинки в фон после коммита транзакции."""
+    if not recipe.image_hash or recipe.renditions_ready:
+        return
+    if settings.IMAGE_PIPELINE_SYNC:
+        make_renditions(recipe.image_hash, recipe.image.name)
+        recipe.renditions_ready = True
+        return
+    transaction.on_commit(lambda: executor().submit(
+        run_renditions, recipe.image_hash, recipe.image.name
+    ))
+
+
+def rendition_urls(recipe, request=None):
+    """Ссылки на готовые копии: {размер: {формат: url}}."""
+    if not recipe.renditions_ready:
+        return None
+    urls = {}
+    for rendition in settings.RECIPE_IMAGE_RENDITIONS:
+        urls[rendition] = {}
+        for image_format in settings.RECIPE_IMAGE_FORMATS:
+            url = default_storage.url(
+                rendition_name(recipe.image_hash, rendition, image_format)
+            )
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls[rendition][EXTENSIONS[image_format]] = url
+    return urls
@@ -0,0 +1,230 @@
+import json
+import random
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Q
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Recipe, Tag
+
+User = get_user_model()
+
+
+def scenarios(recipe_ids, toggle_ids, tag_slugs, rng):
+    """
+    Сценарий: (название, метод, путь) для одного прохода. Переключатели
+    берут рецепт не из избранного и корзины пользователя: добавление
+    сразу отменяется, и его настоящие строки не трогаются.
+    """
+    recipe_id = rng.choice(recipe_ids)
+    toggle_id = rng.choice(toggle_ids)
+    tags = '&'.join(f'tags={slug}' for slug in rng.sample(
+        tag_slugs, min(2, len(tag_slugs))
+    ))
+    return [
+        ('список рецептов', 'get', f'/api/recipes/?page={rng.randint(1, 5)}'),
+        ('рецепт', 'get', f'/api/recipes/{recipe_id}/'),
+        ('фильтр по тегам', 'get', f'/api/recipes/?{tags}'),
+        ('избранное', 'get', '/api/recipes/?is_favorited=1'),
+        ('подписки', 'get', '/api/users/subscriptions/'),
+        ('в избранное', 'post', f'/api/recipes/{toggle_id}/favorite/'),
+        ('из избранного', 'delete', f'/api/recipes/{toggle_id}/favorite/'),
+        ('в корзину', 'post', f'/api/recipes/{toggle_id}/shopping_cart/'),
+        ('из корзины', 'delete', f'/api/recipes/{toggle_id}/shopping_cart/'),
+        ('список покупок', 'get', '/api/recipes/download_shopping_cart/'),
+    ]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+class LocalRunner:
+    """Запросы через тестовый клиент в этом процессе, SQL считается сам."""
+
+    def __init__(self, token):
+        self.client = Client(HTTP_AUTHORIZATION=f'Token {token}')
+
+    def __call__(self, method, path):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = getattr(self.client, method)(path)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+        return response.status_code, elapsed, len(queries)
+
+
+class HTTPRunner:
+    """
+    Запросы к запущенному серверу. Число SQL-запросов берётся
+    из X-Query-Count, он есть при DEBUG.
+    """
+
+    def __init__(self, token, base_url):
+        self.token = token
+        self.base_url = base_url.rstrip('/')
+
+    def __call__(self, method, path):
+        request = urllib.request.Request(
+            self.base_url + path,
+            method=method.upper(),
+            headers={'Authorization': f'Token {self.token}'},
+        )
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                status, headers = response.status, response.headers
+        except urllib.error.HTTPError as error:
+            status, headers = error.code, error.headers
+        elapsed = time.perf_counter() - started
+        queries = headers.get('X-Query-Count')
+        return status, elapsed, int(queries) if queries else None
+
+
+class Command(BaseCommand):
+    """Нагрузочный прогон основных сценариев API."""
+    help = (
+        'Прогоняет сценарии API (списки, фильтры, подписки, '
+        'переключатели, список покупок) и печатает p50/p95/p99 '
+        'и число SQL-запросов на запрос.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations', type=int, default=50,
+            help='сколько раз пройти сценарий'
+        )
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument(
+            '--user', help='username, по умолчанию самый активный'
+        )
+        parser.add_argument(
+            '--url', help='адрес запущенного сервера вместо тестового клиента'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=1,
+            help='параллельные сценарии (только с --url)'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', action='store_true')
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        recipe_ids = list(Recipe.objects.values_list('pk', flat=True)[:1000])
+        if not recipe_ids:
+            raise CommandError('Нет рецептов: запустите seed_synthetic.')
+        toggle_ids = list(
+            Recipe.objects.exclude(
+                Q(in_favorites__user=user) | Q(is_in_shopping_cart__user=user)
+            ).values_list('pk', flat=True)[:1000]
+        )
+        if not toggle_ids:
+            raise CommandError(
+                f'У {user.username} в избранном или корзине все рецепты.'
+            )
+        tag_slugs = list(Tag.objects.values_list('slug', flat=True))
+        token, _ = Token.objects.get_or_create(user=user)
+        rng = random.Random(options['seed'])
+        if options['url']:
+            runner = HTTPRunner(token.key, options['url'])
+        else:
+            runner = LocalRunner(token.key)
+        plans = [
+            scenarios(recipe_ids, toggle_ids, tag_slugs, rng)
+            for _ in range(options['warmup'] + options['iterations'])
+        ]
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']
+        ):
+            for plan in plans[:options['warmup']]:
+                self.run_plan(runner, plan)
+            started = time.perf_counter()
+            results = self.run_all(
+                runner, plans[options['warmup']:], options
+            )
+            elapsed = time.perf_counter() - started
+        self.report(results, elapsed, options['json'])
+
+    def get_user(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'Нет пользователя {username}.')
+        user = User.objects.annotate(
+            activity=Count('carts', distinct=True)
+            + Count('follower', distinct=True)
+        ).order_by('-activity', 'pk').first()
+        if user is None:
+            raise CommandError('Нет пользователей: запустите seed_synthetic.')
+        return user
+
+    def run_plan(self, runner, plan):
+        return [
+            (title, *runner(method, path)) for title, method, path in plan
+        ]
+
+    def run_all(self, runner, plans, options):
+        if options['url'] and options['concurrency'] > 1:
+            with ThreadPoolExecutor(options['concurrency']) as pool:
+                runs = list(pool.map(
+                    lambda plan: self.run_plan(runner, plan), plans
+                ))
+        else:
+            runs = [self.run_plan(runner, plan) for plan in plans]
+        results = defaultdict(list)
+        for run in runs:
+            for title, status, elapsed, queries in run:
+                results[title].append((status, elapsed, queries))
+        return results
+
+    def report(self, results, elapsed, as_json):
+        rows = []
+        total = 0
+        for title, samples in results.items():
+            times = [sample[1] * 1000 for sample in samples]
+            queries = [
+                sample[2] for sample in samples if sample[2] is not None
+            ]
+            total += len(samples)
+            rows.append({
+                'scenario': title,
+                'requests': len(samples),
+                'errors': sum(1 for sample in samples if sample[0] >= 500),
+                'p50_ms': round(percentile(times, 0.5), 2),
+                'p95_ms': round(percentile(times, 0.95), 2),
+                'p99_ms': round(percentile(times, 0.99), 2),
+                'queries': (
+                    round(sum(queries) / len(queries), 1) if queries else None
+                ),
+            })
+        if as_json:
+            self.stdout.write(json.dumps({
+                'scenarios': rows,
+                'requests_per_second': round(total / elapsed, 1),
+            }, ensure_ascii=False))
+            return
+        self.stdout.write(
+            f'{"сценарий":<18}{"запросов":>9}{"ошибок":>8}'
+            f'{"p50 мс":>10}{"p95 мс":>10}{"p99 мс":>10}{"SQL":>7}'
+        )
+        for row in rows:
+            self.stdout.write(
+                f'{row["scenario"]:<18}{row["requests"]:>9}'
+                f'{row["errors"]:>8}{row["p50_ms"]:>10}{row["p95_ms"]:>10}'
+                f'{row["p99_ms"]:>10}{str(row["queries"] or "-"):>7}'
+            )
+        self.stdout.write(f'{total / elapsed:.1f} запросов/с')
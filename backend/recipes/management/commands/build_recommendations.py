@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from recipes.recommendations import build_similarities
+
+
+class Command(BaseCommand):
+    """Пересчитывает похожие рецепты по избранному и корзинам."""
+    help = 'Пересчитывает похожие рецепты по избранному и корзинам.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipe', dest='recipes', type=int, action='append',
+            help='id рецепта, можно указать несколько раз'
+        )
+        parser.add_argument(
+            '--stale', action='store_true',
+            help='только рецепты, у которых менялись избранное и корзины'
+        )
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument('--top', type=int)
+
+    def handle(self, *args, **options):
+        recipes = options['recipes']
+        if options['stale']:
+            recipes = list(Recipe.objects.filter(
+                recommendations_stale=True
+            ).values_list('pk', flat=True))
+        count = build_similarities(
+            recipes, options['batch_size'], options['top']
+        )
+        self.stdout.write(f'Похожие рецепты пересчитаны: {count}.')
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.services import rebuild_shopping_list, shopping_list_drift
+
+
+class Command(BaseCommand):
+    """Сверяет сводные списки покупок с корзинами."""
+    help = 'Сверяет сводные списки покупок с корзинами.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', dest='users', type=int, action='append',
+            help='id пользователя, можно указать несколько раз'
+        )
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='пересобрать списки пользователей с расхождениями'
+        )
+
+    def handle(self, *args, **options):
+        drift = shopping_list_drift(options['users'])
+        for user_id, ingredient_id, expected, actual in drift:
+            self.stdout.write(
+                f'user={user_id} ingredient={ingredient_id}: '
+                f'ожидалось {expected}, в списке {actual}'
+            )
+        if not drift:
+            self.stdout.write('Расхождений нет.')
+            return
+        if options['fix']:
+            users = sorted({user_id for user_id, *_ in drift})
+            rebuild_shopping_list(users)
+            self.stdout.write(f'Исправлено пользователей: {len(users)}.')
+            return
+        raise CommandError(f'Найдено расхождений: {len(drift)}.')
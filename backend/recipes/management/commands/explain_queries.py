@@ -0,0 +1,104 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+
+from recipes.models import FavoriteRecipe, Recipe, ShoppingCart, Tag
+from recipes.synthetic import seed_recipes
+from users.models import Follow
+
+User = get_user_model()
+PAGE_SIZE = 6
+
+
+def hot_queries(user, tag_slugs):
+    """Запросы, которые чаще всего выполняет API."""
+    return {
+        'главная страница': Recipe.objects.all()[:PAGE_SIZE],
+        'рецепты автора': Recipe.objects.filter(
+            author=user
+        )[:PAGE_SIZE],
+        'фильтр по тегам': Recipe.objects.filter(
+            tags__slug__in=tag_slugs
+        ).distinct()[:PAGE_SIZE],
+        'избранное': Recipe.objects.filter(
+            in_favorites__user=user
+        )[:PAGE_SIZE],
+        'корзина': Recipe.objects.filter(
+            is_in_shopping_cart__user=user
+        )[:PAGE_SIZE],
+        'флаги пользователя': Recipe.objects.annotate(
+            is_favorited=Exists(FavoriteRecipe.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+        )[:PAGE_SIZE],
+        'подписки': User.objects.filter(
+            following__user=user
+        )[:PAGE_SIZE],
+    }
+
+
+class Command(BaseCommand):
+    """Планы и время горячих запросов с индексами и без них."""
+    help = (
+        'Показывает планы выполнения и время горячих запросов API '
+        'с индексами из Meta.indexes и без них.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed-recipes', type=int, default=0,
+            help='сначала создать столько синтетических рецептов'
+        )
+        parser.add_argument(
+            '--analyze', action='store_true',
+            help='EXPLAIN ANALYZE (Postgres)'
+        )
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        user = User.objects.order_by('pk').first()
+        if user is None:
+            raise CommandError('Нужен хотя бы один пользователь.')
+        if options['seed_recipes']:
+            author_ids = list(User.objects.values_list('pk', flat=True))
+            for created in seed_recipes(options['seed_recipes'], author_ids):
+                self.stdout.write(f'Создано рецептов: {created}')
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+        queries = hot_queries(
+            user, list(Tag.objects.values_list('slug', flat=True)[:2])
+        )
+        self.stdout.write(self.style.MIGRATE_HEADING('С индексами'))
+        self.explain(queries, options)
+        with transaction.atomic():
+            self.drop_indexes()
+            self.stdout.write(self.style.MIGRATE_HEADING('Без индексов'))
+            self.explain(queries, options)
+            transaction.set_rollback(True)
+
+    def drop_indexes(self):
+        """Удаляет индексы из Meta внутри транзакции, она откатится."""
+        with connection.cursor() as cursor:
+            for model in (Recipe, FavoriteRecipe, ShoppingCart, Follow):
+                for index in model._meta.indexes:
+                    cursor.execute(
+                        f'DROP INDEX {connection.ops.quote_name(index.name)}'
+                    )
+
+    def explain(self, queries, options):
+        explain_options = {'analyze': True} if options['analyze'] else {}
+        for title, queryset in queries.items():
+            self.stdout.write(self.style.SQL_KEYWORD(title))
+            self.stdout.write(queryset.explain(**explain_options))
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                list(queryset.all())
+            elapsed = (time.perf_counter() - started) / options['repeat']
+            self.stdout.write(f'среднее время: {elapsed * 1000:.2f} мс\n')
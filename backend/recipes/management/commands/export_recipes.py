@@ -0,0 +1,37 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.transfer import export_recipes
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """Выгружает рецепты в NDJSON."""
+    help = 'Выгружает рецепты в NDJSON (файл или stdout).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='файл NDJSON, по умолчанию stdout'
+        )
+        parser.add_argument(
+            '--author', help='только рецепты пользователя с этим username'
+        )
+        parser.add_argument('--batch-size', type=int)
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.all()
+        if options['author']:
+            recipes = recipes.filter(author__username=options['author'])
+        lines = export_recipes(recipes, options['batch_size'])
+        if options['path'] == '-':
+            sys.stdout.writelines(lines)
+            return
+        try:
+            with open(options['path'], 'w', encoding='utf-8') as stream:
+                stream.writelines(lines)
+        except OSError as error:
+            raise CommandError(
+                f'Не удалось записать {options["path"]}: {error}'
+            )
@@ -0,0 +1,77 @@
+import io
+import json
+import sys
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from api.transfer import RecipeImporter
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """Загружает рецепты из NDJSON."""
+    help = (
+        'Загружает рецепты из NDJSON (файл или «-» для stdin): '
+        'теги по slug, ингредиенты по названию и единице, '
+        'картинка — путь в хранилище.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='файл NDJSON, «-» читает stdin')
+        parser.add_argument(
+            '--author', required=True, help='username автора рецептов'
+        )
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument(
+            '--keep-pub-date', action='store_true',
+            help='брать даты публикации из файла'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='только проверить данные, ничего не записывая'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            author = User.objects.get(username=options['author'])
+        except User.DoesNotExist:
+            raise CommandError(f'Нет пользователя {options["author"]}.')
+        importer = RecipeImporter(
+            author,
+            batch_size=options['batch_size'],
+            keep_pub_date=options['keep_pub_date'],
+            dry_run=options['dry_run'],
+        )
+        started = time.monotonic()
+        if options['path'] == '-':
+            self.load(importer, io.TextIOWrapper(
+                sys.stdin.buffer, encoding='utf-8'
+            ), started)
+        else:
+            try:
+                with open(options['path'], encoding='utf-8') as stream:
+                    self.load(importer, stream, started)
+            except OSError as error:
+                raise CommandError(
+                    f'Не удалось прочитать {options["path"]}: {error}'
+                )
+        for error in importer.errors:
+            self.stderr.write(
+                f'Строка {error["line"]}: '
+                f'{json.dumps(error["errors"], ensure_ascii=False)}'
+            )
+        return (
+            f'Загружено рецептов: {importer.created}, '
+            f'с ошибками: {importer.failed}'
+        )
+
+    def load(self, importer, stream, started):
+        for created in importer.load(stream):
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'{created} рецептов, '
+                f'{created / max(elapsed, 1e-6):.0f} рецептов/с'
+            )
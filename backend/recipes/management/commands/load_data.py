@@ -1,35 +1,200 @@
 import csv
+import io
+import json
+import sys
+import time
+from itertools import islice
+
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 
+from core.versions import bump_version
 from recipes.models import Ingredient
 
+NAME_MAX_LENGTH = Ingredient._meta.get_field('name').max_length
+UNIT_MAX_LENGTH = Ingredient._meta.get_field('measurement_unit').max_length
+
+
+def iter_csv(stream):
+    for row in csv.reader(stream):
+        if row:
+            yield row[0], row[1] if len(row) > 1 else ''
+
+
+def decode_items(decoder, buffer):
+    """Разбирает готовые элементы массива, возвращает остаток буфера."""
+    items = []
+    while True:
+        buffer = buffer.lstrip()
+        if buffer.startswith(']'):
+            return items, buffer, True
+        if buffer.startswith(','):
+            buffer = buffer[1:]
+            continue
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            return items, buffer, False
+        items.append((item.get('name', ''), item.get('measurement_unit', '')))
+        buffer = buffer[end:]
+
+
+def iter_json(stream, chunk_size=64 * 1024):
+    """Читает JSON-массив объектов по частям, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = stream.read(chunk_size).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидался JSON-массив ингредиентов.')
+    buffer = buffer[1:]
+    while True:
+        items, buffer, finished = decode_items(decoder, buffer)
+        yield from items
+        if finished:
+            return
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            raise CommandError('JSON-массив ингредиентов оборван.')
+        buffer += chunk
+
+
+READERS = {
+    'csv': iter_csv,
+    'json': iter_json,
+}
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
+
 
 class Command(BaseCommand):
     """Заполняем базу данных ингредиентами."""
+    help = (
+        'Загружает ингредиенты пачками из CSV или JSON '
+        '(файл или «-» для stdin), повторная загрузка безопасна.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths', nargs='*',
+            default=[f'{settings.BASE_DIR}/data/ingredients.csv'],
+            help='файлы с ингредиентами, «-» читает stdin'
+        )
+        parser.add_argument(
+            '--format', choices=READERS,
+            help='формат данных, по умолчанию по расширению файла'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='только проверить данные, ничего не записывая'
+        )
+        parser.add_argument(
+            '--copy', action='store_true',
+            help='загрузка через COPY (только Postgres)'
+        )
+
     def handle(self, *args, **options):
-        try:
-            with open(
-                f'{settings.BASE_DIR}/data/ingredients.csv',
-                'r',
-                encoding='utf-8'
-            ) as csv_file:
-                reader = csv.reader(csv_file)
-
-                for row in reader:
-                    try:
-                        obj, created = Ingredient.objects.get_or_create(
-                            name=row[0],
-                            measurement_unit=row[1],
-                        )
-                        if not created:
-                            print(
-                                f'Ингредиент {obj} уже существует в базе.'
-                            )
-                    except Exception as error:
-                        print(f'Ошибка в строке {row}: {error}')
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError('--copy доступен только для Postgres.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+        before = Ingredient.objects.count()
+        self.processed = 0
+        self.started = time.monotonic()
+        for path in options['paths']:
+            self.load(path, options)
+        if options['dry_run']:
             return (
-                f'{Ingredient.objects.count()} ингредиентов успешно загружено'
+                f'Проверено строк: {self.processed}, '
+                'в базе ничего не менялось'
+            )
+        bump_version('ingredients')
+        added = Ingredient.objects.count() - before
+        return (
+            f'Обработано строк: {self.processed}, добавлено ингредиентов: '
+            f'{added} за {time.monotonic() - self.started:.1f} с'
+        )
+
+    def load(self, path, options):
+        data_format = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if data_format not in READERS:
+            raise CommandError(f'Не удалось определить формат {path}.')
+        if path == '-':
+            stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+            self.load_stream(READERS[data_format](stream), options)
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as stream:
+                self.load_stream(READERS[data_format](stream), options)
+        except OSError as error:
+            raise CommandError(f'Неудалось прочитать {path}: {error}')
+
+    def clean_rows(self, rows):
+        for name, measurement_unit in rows:
+            name, measurement_unit = name.strip(), measurement_unit.strip()
+            if (
+                not name or not measurement_unit
+                or len(name) > NAME_MAX_LENGTH
+                or len(measurement_unit) > UNIT_MAX_LENGTH
+            ):
+                self.stderr.write(
+                    f'Ошибка в строке {[name, measurement_unit]}: '
+                    'пустое или слишком длинное значение'
+                )
+                continue
+            yield name, measurement_unit
+
+    def load_stream(self, rows, options):
+        rows = self.clean_rows(rows)
+        if options['copy'] and not options['dry_run']:
+            with transaction.atomic():
+                self.copy_rows(rows, options['batch_size'])
+            return
+        for batch in batches(rows, options['batch_size']):
+            if not options['dry_run']:
+                Ingredient.objects.bulk_create(
+                    [
+                        Ingredient(name=name, measurement_unit=unit)
+                        for name, unit in batch
+                    ],
+                    ignore_conflicts=True
+                )
+            self.report(len(batch))
+
+    def copy_rows(self, rows, batch_size):
+        """COPY во временную таблицу и один INSERT ... ON CONFLICT."""
+        table = Ingredient._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE ingredient_import '
+                '(name text, measurement_unit text) ON COMMIT DROP'
+            )
+            for batch in batches(rows, batch_size):
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(batch)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    'COPY ingredient_import (name, measurement_unit) '
+                    'FROM STDIN WITH (FORMAT csv)',
+                    buffer
+                )
+                self.report(len(batch))
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT DISTINCT name, measurement_unit '
+                'FROM ingredient_import ON CONFLICT DO NOTHING'
             )
-        except Exception as error:
-            raise Exception(f'Неудалось заполнить базу данных: {error}')
+
+    def report(self, count):
+        self.processed += count
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(
+            f'{self.processed} строк, '
+            f'{self.processed / max(elapsed, 1e-6):.0f} строк/с'
+        )
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from api.search import update_search_vectors
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """Пересчитывает поисковые векторы рецептов."""
+    help = 'Пересчитывает поисковые векторы рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--missing', action='store_true',
+            help='только рецепты без вектора'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.all()
+        if options['missing']:
+            recipes = recipes.filter(search_vector__isnull=True)
+        count = update_search_vectors(recipes)
+        self.stdout.write(f'Поисковые векторы обновлены: {count}.')
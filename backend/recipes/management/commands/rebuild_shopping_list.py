@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from recipes.services import rebuild_shopping_list
+
+
+class Command(BaseCommand):
+    """Пересобирает сводные списки покупок по корзинам."""
+    help = 'Пересобирает сводные списки покупок по корзинам.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', dest='users', type=int, action='append',
+            help='id пользователя, можно указать несколько раз'
+        )
+
+    def handle(self, *args, **options):
+        count = rebuild_shopping_list(options['users'])
+        self.stdout.write(f'Списки покупок пересобраны: {count} позиций.')
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from recipes.services import reconcile_counters
+
+
+class Command(BaseCommand):
+    """Сверяет счётчики избранного и корзин рецептов."""
+    help = 'Сверяет счётчики избранного и корзин рецептов.'
+
+    def handle(self, *args, **options):
+        fixed = reconcile_counters()
+        self.stdout.write(f'Исправлено счётчиков: {fixed}.')
@@ -0,0 +1,115 @@
+import random
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.versions import bump_version
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.services import rebuild_shopping_list, reconcile_counters
+from recipes.synthetic import (
+    SYNTHETIC_IMAGE, power_law_weights, seed_carts, seed_favorites,
+    seed_follows, seed_recipe_contents, seed_recipes, seed_users
+)
+
+User = get_user_model()
+
+SYNTHETIC_TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+
+
+class Command(BaseCommand):
+    """Заполняет базу синтетическими данными для нагрузочных тестов."""
+    help = (
+        'Создаёт пользователей, рецепты, подписки, избранное и корзины '
+        'с неравномерным распределением: авторы по степенному закону, '
+        'популярность рецептов по Ципфу.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--follows-per-user', type=float, default=5)
+        parser.add_argument('--favorites-per-user', type=float, default=10)
+        parser.add_argument('--carts-per-user', type=float, default=3)
+        parser.add_argument(
+            '--author-exponent', type=float, default=1.2,
+            help='показатель степенного закона для авторов'
+        )
+        parser.add_argument(
+            '--zipf-exponent', type=float, default=1.0,
+            help='показатель закона Ципфа для избранного и корзин'
+        )
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='зерно генератора, одинаковое зерно даёт одинаковые данные'
+        )
+
+    def handle(self, *args, **options):
+        ingredient_ids = list(Ingredient.objects.values_list('pk', flat=True))
+        if not ingredient_ids:
+            raise CommandError('Сначала загрузите ингредиенты: load_data.')
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        tag_ids = self.tag_ids()
+        for created in seed_users(options['users'], batch_size):
+            self.stdout.write(f'Пользователей: {created}')
+        user_ids = list(
+            User.objects.order_by('pk').values_list('pk', flat=True)
+        )
+        rng.shuffle(user_ids)
+        authors = user_ids[:max(1, len(user_ids) // 5)]
+        for created in seed_recipes(
+            options['recipes'], authors, batch_size,
+            author_weights=power_law_weights(
+                len(authors), options['author_exponent']
+            ),
+            rng=rng,
+        ):
+            self.stdout.write(f'Рецептов: {created}')
+        empty = list(Recipe.objects.filter(
+            image=SYNTHETIC_IMAGE, amount_ingredient__isnull=True
+        ).order_by('pk').values_list('pk', flat=True))
+        for done in seed_recipe_contents(
+            empty, ingredient_ids, tag_ids, batch_size, rng
+        ):
+            self.stdout.write(f'Состав рецептов: {done}')
+        recipe_ids = list(
+            Recipe.objects.order_by('pk').values_list('pk', flat=True)
+        )
+        rng.shuffle(recipe_ids)
+        links = (
+            ('Подписок', seed_follows, authors,
+             options['follows_per_user'], options['author_exponent']),
+            ('Избранного', seed_favorites, recipe_ids,
+             options['favorites_per_user'], options['zipf_exponent']),
+            ('Корзин', seed_carts, recipe_ids,
+             options['carts_per_user'], options['zipf_exponent']),
+        )
+        for title, seed, targets, per_user, exponent in links:
+            total = 0
+            for count in seed(
+                user_ids, targets, per_user, exponent,
+                batch_size=batch_size, rng=rng
+            ):
+                total += count
+                self.stdout.write(f'{title}: {total}')
+        self.stdout.write(
+            f'Исправлено счётчиков: {reconcile_counters()}'
+        )
+        self.stdout.write(
+            f'Позиций в списках покупок: {rebuild_shopping_list()}'
+        )
+        bump_version('recipes')
+
+    def tag_ids(self):
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create([
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in SYNTHETIC_TAGS
+            ])
+            bump_version('tags')
+        return list(Tag.objects.values_list('pk', flat=True))
@@ -1,4 +1,5 @@
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
 
@@ -50,6 +51,12 @@ class Ingredient(models.Model):
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
         ordering = ('name',)
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient_unit'
+            )
+        ]
 
     def __str__(self):
         return f'{self.name}'
@@ -77,6 +84,18 @@ class Recipe(models.Model):
         null=False,
         blank=False,
     )
+    image_hash = models.CharField(
+        verbose_name='Хеш картинки',
+        max_length=64,
+        blank=True,
+        db_index=True,
+        editable=False,
+    )
+    renditions_ready = models.BooleanField(
+        verbose_name='Копии картинки готовы',
+        default=False,
+        editable=False,
+    )
     text = models.TextField(
         verbose_name='Текст',
     )
@@ -102,11 +121,45 @@ class Recipe(models.Model):
             message='Минимальное время приготовления - 1 минута.')],
         verbose_name='Время приготовления',
     )
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False,
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False,
+    )
+    cart_count = models.PositiveIntegerField(
+        verbose_name='В корзинах',
+        default=0,
+        editable=False,
+    )
+    recommendations_stale = models.BooleanField(
+        verbose_name='Похожие рецепты устарели',
+        default=True,
+        db_index=True,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date', )
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_date_idx'
+            ),
+            models.Index(
+                fields=['-favorites_count', '-pub_date', '-id'],
+                name='recipe_popular_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.name}'
@@ -202,10 +255,75 @@ class ShoppingCart(models.Model):
         verbose_name_plural = 'Рецепты в списке покупок'
         constraints = [
             models.UniqueConstraint(
-                fields=['recipe', 'user'],
+                fields=['user', 'recipe'],
                 name='unique_recipe_user'
             )
         ]
 
     def __str__(self):
         return f'{self.user} -> {self.recipe}'
+
+
+class ShoppingListItem(models.Model):
+    """Сводный список покупок: сумма ингредиентов из корзины."""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name='Пользователь списка',
+        related_name='shopping_list',
+        on_delete=models.CASCADE,
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        verbose_name='Ингредиент',
+        related_name='shopping_list_items',
+        on_delete=models.CASCADE,
+    )
+    total_amount = models.IntegerField(
+        default=0,
+        verbose_name='Общее количество',
+    )
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списка покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_ingredient_in_shopping_list'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user} -> {self.ingredient}: {self.total_amount}'
+
+
+class RecipeSimilarity(models.Model):
+    """Похожий рецепт по совместному добавлению в избранное и корзину."""
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        related_name='similar_recipes',
+        on_delete=models.CASCADE,
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        verbose_name='Похожий рецепт',
+        related_name='+',
+        on_delete=models.CASCADE,
+    )
+    score = models.FloatField(
+        verbose_name='Сходство',
+    )
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='unique_similar_recipe'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} ~ {self.similar}: {self.score:.3f}'
@@ -0,0 +1,146 @@
+import heapq
+import math
+from collections import Counter, defaultdict
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Exists, OuterRef, Q
+
+from .models import FavoriteRecipe, Recipe, RecipeSimilarity, ShoppingCart
+
+
+def touched(model, recipe_ids):
+    return Exists(model.objects.filter(
+        user_id=OuterRef('user_id'), recipe_id__in=recipe_ids
+    ))
+
+
+def interactions(recipe_ids=None):
+    """
+    Пары (пользователь, рецепт) из избранного и корзин без повторов,
+    по порядку пользователей. С recipe_ids — только пользователи,
+    у которых есть хотя бы один из этих рецептов.
+    """
+    querysets = []
+    for model in (FavoriteRecipe, ShoppingCart):
+        queryset = model.objects.all()
+        if recipe_ids is not None:
+            queryset = queryset.annotate(
+                in_favorites=touched(FavoriteRecipe, recipe_ids),
+                in_carts=touched(ShoppingCart, recipe_ids),
+            ).filter(Q(in_favorites=True) | Q(in_carts=True))
+        querysets.append(queryset.values_list('user_id', 'recipe_id'))
+    return querysets[0].union(querysets[1]).order_by('user_id', 'recipe_id')
+
+
+def recipe_users():
+    """Сколько пользователей добавили каждый рецепт."""
+    return Counter(
+        recipe_id for _, recipe_id in interactions().iterator()
+    )
+
+
+def similarities(recipe_ids, users_count, top_k):
+    """
+    Косинусная мера совместных добавлений для recipe_ids:
+    recipe_id -> top_k пар (score, similar_id).
+    Матрица хранится разреженно, только по строкам recipe_ids.
+    """
+    targets = set(recipe_ids)
+    together = defaultdict(Counter)
+    for _, rows in groupby(
+        interactions(recipe_ids).iterator(), key=itemgetter(0)
+    ):
+        items = [recipe_id for _, recipe_id in rows]
+        for recipe_id in targets.intersection(items):
+            row = together[recipe_id]
+            for similar_id in items:
+                if similar_id != recipe_id:
+                    row[similar_id] += 1
+    return {
+        recipe_id: heapq.nlargest(top_k, (
+            (
+                count / math.sqrt(
+                    users_count[recipe_id] * users_count[similar_id]
+                ),
+                similar_id
+            )
+            for similar_id, count in row.items()
+        ))
+        for recipe_id, row in together.items()
+    }
+
+
+@transaction.atomic
+def store_similarities(recipe_ids, neighbours):
+    RecipeSimilarity.objects.filter(recipe_id__in=recipe_ids).delete()
+    similarities = [
+        RecipeSimilarity(
+            recipe_id=recipe_id, similar_id=similar_id, score=score
+        )
+        for recipe_id, row in neighbours.items()
+        for score, similar_id in row
+    ]
+    ops = connections[router.db_for_write(RecipeSimilarity)].ops
+    batch_size = ops.bulk_batch_size(
+        RecipeSimilarity._meta.concrete_fields, similarities
+    )
+    RecipeSimilarity.objects.bulk_create(
+        similarities,
+        batch_size=max(
+            1, min(settings.RECOMMENDATIONS_BATCH_SIZE, batch_size)
+        ),
+    )
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        recommendations_stale=False
+    )
+
+
+def build_similarities(recipe_ids=None, batch_size=None, top_k=None):
+    """
+    Пересчитывает похожие рецепты пачками по batch_size рецептов.
+    Без recipe_ids пересчитываются все рецепты.
+    """
+    batch_size = batch_size or settings.RECOMMENDATIONS_BATCH_SIZE
+    top_k = top_k or settings.RECOMMENDATIONS_TOP_K
+    if recipe_ids is None:
+        recipe_ids = Recipe.objects.values_list('pk', flat=True)
+    recipe_ids = sorted(recipe_ids)
+    if not recipe_ids:
+        return 0
+    users_count = recipe_users()
+    for start in range(0, len(recipe_ids), batch_size):
+        batch = recipe_ids[start:start + batch_size]
+        store_similarities(batch, similarities(batch, users_count, top_k))
+    return len(recipe_ids)
+
+
+def mark_stale(recipe_ids):
+    Recipe.objects.filter(
+        pk__in=recipe_ids, recommendations_stale=False
+    ).update(recommendations_stale=True)
+
+
+def recommended_ids(user, limit):
+    """
+    Рецепты для пользователя: сумма сходств с его последними
+    рецептами из избранного и корзины, без уже добавленных.
+    """
+    history = settings.RECOMMENDATIONS_HISTORY
+    favorites = FavoriteRecipe.objects.filter(user=user).values_list(
+        'recipe_id', flat=True
+    ).order_by('-id')[:history]
+    carts = ShoppingCart.objects.filter(user=user).values_list(
+        'recipe_id', flat=True
+    ).order_by('-id')[:history]
+    seen = set(favorites) | set(carts)
+    scores = Counter()
+    rows = RecipeSimilarity.objects.filter(
+        recipe_id__in=seen
+    ).values_list('similar_id', 'score')
+    for similar_id, score in rows:
+        if similar_id not in seen:
+            scores[similar_id] += score
+    return [recipe_id for recipe_id, _ in scores.most_common(limit)]
@@ -0,0 +1,203 @@
+from collections import Counter
+
+from django.db import connections, router, transaction
+from django.db.models import (
+    Case, Count, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+)
+from django.db.models.functions import Coalesce
+
+from .models import (
+    AmountImgredientsInRecipe, FavoriteRecipe, Recipe, ShoppingCart,
+    ShoppingListItem
+)
+
+SHOPPING_LIST_BATCH_SIZE = 1000
+
+
+def create_shopping_list_items(items):
+    """bulk_create пачками, но не больше, чем позволяет база."""
+    ops = connections[router.db_for_write(ShoppingListItem)].ops
+    batch_size = ops.bulk_batch_size(
+        ShoppingListItem._meta.concrete_fields, items
+    )
+    ShoppingListItem.objects.bulk_create(
+        items,
+        batch_size=max(1, min(SHOPPING_LIST_BATCH_SIZE, batch_size)),
+        ignore_conflicts=True,
+    )
+
+
+def recipe_amounts(recipe_ids):
+    """Суммарное количество каждого ингредиента в рецептах."""
+    amounts = Counter()
+    rows = AmountImgredientsInRecipe.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('ingredient_id', 'amount')
+    for ingredient_id, amount in rows:
+        amounts[ingredient_id] += amount
+    return amounts
+
+
+@transaction.atomic
+def apply_shopping_list_delta(user_ids, delta):
+    """
+    Прибавляет delta (ingredient_id -> количество) к спискам покупок
+    пользователей: вставка недостающих строк, одно UPDATE через F()
+    и удаление обнулившихся позиций.
+    """
+    delta = {
+        ingredient_id: amount
+        for ingredient_id, amount in delta.items() if amount
+    }
+    user_ids = list(user_ids)
+    if not delta or not user_ids:
+        return
+    create_shopping_list_items([
+        ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id)
+        for user_id in user_ids
+        for ingredient_id, amount in delta.items() if amount > 0
+    ])
+    items = ShoppingListItem.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=delta
+    )
+    items.update(total_amount=F('total_amount') + Case(
+        *[
+            When(ingredient_id=ingredient_id, then=Value(amount))
+            for ingredient_id, amount in delta.items()
+        ],
+        default=Value(0),
+        output_field=IntegerField(),
+    ))
+    items.filter(total_amount__lte=0).delete()
+
+
+def add_to_shopping_list(user, recipe_ids):
+    apply_shopping_list_delta([user.id], recipe_amounts(recipe_ids))
+
+
+def remove_from_shopping_list(user, recipe_ids):
+    amounts = recipe_amounts(recipe_ids)
+    apply_shopping_list_delta(
+        [user.id],
+        {ingredient_id: -amount for ingredient_id, amount in amounts.items()}
+    )
+
+
+def change_recipe_amounts(recipe, old_amounts, new_amounts):
+    """Переносит изменение состава рецепта в списки покупок."""
+    delta = {
+        ingredient_id: (
+            new_amounts.get(ingredient_id, 0)
+            - old_amounts.get(ingredient_id, 0)
+        )
+        for ingredient_id in set(old_amounts) | set(new_amounts)
+    }
+    users = ShoppingCart.objects.filter(
+        recipe=recipe
+    ).values_list('user_id', flat=True)
+    apply_shopping_list_delta(users, delta)
+
+
+def expected_shopping_list(user_ids=None):
+    """Список покупок, посчитанный заново по корзинам."""
+    if user_ids is None:
+        lookup = {'recipe__is_in_shopping_cart__isnull': False}
+    else:
+        lookup = {'recipe__is_in_shopping_cart__user_id__in': user_ids}
+    rows = AmountImgredientsInRecipe.objects.filter(**lookup).values_list(
+        'recipe__is_in_shopping_cart__user_id', 'ingredient_id'
+    ).annotate(total=Sum('amount')).order_by()
+    return {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in rows.iterator()
+    }
+
+
+@transaction.atomic
+def rebuild_shopping_list(user_ids=None):
+    """Пересобирает списки покупок с нуля."""
+    items = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        items = items.filter(user_id__in=user_ids)
+    items.delete()
+    expected = expected_shopping_list(user_ids)
+    create_shopping_list_items([
+        ShoppingListItem(
+            user_id=user_id,
+            ingredient_id=ingredient_id,
+            total_amount=total
+        )
+        for (user_id, ingredient_id), total in expected.items()
+    ])
+    return len(expected)
+
+
+def shopping_list_drift(user_ids=None):
+    """
+    Расхождения между списком покупок и корзинами:
+    (user_id, ingredient_id, ожидаемое, фактическое).
+    """
+    expected = expected_shopping_list(user_ids)
+    items = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        items = items.filter(user_id__in=user_ids)
+    actual = {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in items.values_list(
+            'user_id', 'ingredient_id', 'total_amount'
+        ).iterator()
+    }
+    drift = []
+    for key in sorted(set(expected) | set(actual)):
+        if expected.get(key, 0) != actual.get(key, 0):
+            drift.append((*key, expected.get(key, 0), actual.get(key, 0)))
+    return drift
+
+
+COUNTER_FIELDS = {
+    FavoriteRecipe: 'favorites_count',
+    ShoppingCart: 'cart_count',
+}
+
+
+def change_counter(model, recipe_ids, delta):
+    """Сдвигает счётчик рецептов для модели избранного или корзины."""
+    field = COUNTER_FIELDS[model]
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        **{field: F(field) + delta}
+    )
+
+
+def release_user_counters(user):
+    """Вычитает из счётчиков рецепты удаляемого пользователя."""
+    for model in COUNTER_FIELDS:
+        recipe_ids = model.objects.filter(user=user).values_list(
+            'recipe_id', flat=True
+        )
+        change_counter(model, list(recipe_ids), -1)
+
+
+def actual_count(model):
+    return Coalesce(Subquery(
+        model.objects.filter(recipe=OuterRef('pk')).order_by().values(
+            'recipe'
+        ).annotate(total=Count('pk')).values('total'),
+        output_field=IntegerField()
+    ), Value(0))
+
+
+@transaction.atomic
+def reconcile_counters():
+    """
+    Пересчитывает счётчики рецептов, которые разошлись с избранным
+    и корзинами. Возвращает число исправленных рецептов.
+    """
+    fixed = 0
+    for model, field in COUNTER_FIELDS.items():
+        drifted = Recipe.objects.annotate(
+            actual=actual_count(model)
+        ).filter(~Q(**{field: F('actual')})).values_list('pk', flat=True)
+        fixed += Recipe.objects.filter(pk__in=list(drifted)).update(
+            **{field: actual_count(model)}
+        )
+    return fixed
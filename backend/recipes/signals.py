@@ -0,0 +1,74 @@
+import logging
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+
+from .models import Ingredient, Recipe, ShoppingCart
+from .services import (
+    apply_shopping_list_delta, recipe_amounts, release_user_counters
+)
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_deleted_recipe_from_shopping_lists(sender, instance, **kwargs):
+    """Каскадное удаление корзин не должно оставлять хвостов в списках."""
+    users = ShoppingCart.objects.filter(
+        recipe=instance
+    ).values_list('user_id', flat=True)
+    amounts = recipe_amounts([instance.id])
+    apply_shopping_list_delta(
+        users,
+        {ingredient_id: -amount for ingredient_id, amount in amounts.items()}
+    )
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def release_deleted_user_counters(sender, instance, **kwargs):
+    """Избранное и корзины пользователя удалятся каскадом."""
+    release_user_counters(instance)
+
+
+def has_trigram_extension(connection, cursor):
+    """
+    pg_trgm ставится, если его ещё нет; CREATE EXTENSION требует
+    прав суперпользователя, без них trigram-индекс пропускается.
+    """
+    cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+    if cursor.fetchone():
+        return True
+    try:
+        with transaction.atomic(using=connection.alias):
+            cursor.execute('CREATE EXTENSION pg_trgm')
+    except DatabaseError:
+        logger.warning(
+            'Нет прав на CREATE EXTENSION pg_trgm, trigram-индекс '
+            'ингредиентов не создан. Установите расширение вручную.'
+        )
+        return False
+    return True
+
+
+def create_search_indexes(sender, using, **kwargs):
+    """
+    Trigram-индекс для поиска ингредиентов по UPPER(name) LIKE
+    и GIN-индекс полнотекстового поиска рецептов.
+    Создаются после migrate только на Postgres.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        if has_trigram_extension(connection, cursor):
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_trgm '
+                f'ON {Ingredient._meta.db_table} '
+                'USING gin (UPPER(name) gin_trgm_ops)'
+            )
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS recipes_recipe_search_gin '
+            f'ON {Recipe._meta.db_table} USING gin (search_vector)'
+        )
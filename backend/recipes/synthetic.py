@@ -0,0 +1,161 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from users.models import Follow
+from .models import (
+    AmountImgredientsInRecipe, FavoriteRecipe, Recipe, ShoppingCart
+)
+
+User = get_user_model()
+
+SYNTHETIC_IMAGE = 'recipes/synthetic.jpg'
+
+
+@contextmanager
+def explicit_pub_date():
+    """Позволяет задать pub_date вручную при bulk_create."""
+    field = Recipe._meta.get_field('pub_date')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def power_law_weights(count, exponent):
+    """Накопленные веса рангов 1..count, вес ранга k пропорционален k^-s."""
+    return list(accumulate(rank ** -exponent for rank in range(1, count + 1)))
+
+
+def seed_recipes(count, author_ids, batch_size=10000, days=365 * 3,
+                 author_weights=None, rng=random):
+    """
+    Создаёт count рецептов пачками, даты публикации за последние days.
+    author_weights — накопленные веса авторов для неравномерного выбора.
+    """
+    now = timezone.now()
+    created = 0
+    with explicit_pub_date():
+        while created < count:
+            size = min(batch_size, count - created)
+            with transaction.atomic():
+                Recipe.objects.bulk_create([
+                    Recipe(
+                        author_id=rng.choices(
+                            author_ids, cum_weights=author_weights
+                        )[0],
+                        name=f'Синтетический рецепт {created + number}',
+                        text='Сгенерировано для нагрузочных тестов.',
+                        image=SYNTHETIC_IMAGE,
+                        cooking_time=rng.randint(5, 180),
+                        pub_date=now - timedelta(
+                            seconds=rng.randint(0, days * 24 * 3600)
+                        ),
+                    )
+                    for number in range(size)
+                ])
+            created += size
+            yield created
+
+
+def seed_users(count, batch_size=10000, password='synthetic'):
+    """Пользователи synthetic_N с одним общим хешем пароля."""
+    start = User.objects.filter(username__startswith='synthetic_').count()
+    hashed = make_password(password)
+    created = 0
+    while created < count:
+        size = min(batch_size, count - created)
+        User.objects.bulk_create([
+            User(
+                username=f'synthetic_{number}',
+                email=f'synthetic_{number}@example.com',
+                first_name='Синтетический',
+                last_name=f'Пользователь {number}',
+                password=hashed,
+            )
+            for number in range(start + created, start + created + size)
+        ])
+        created += size
+        yield created
+
+
+def seed_recipe_contents(recipe_ids, ingredient_ids, tag_ids,
+                         batch_size=10000, rng=random):
+    """Ингредиенты (3–10) и теги (1–3) для рецептов без состава."""
+    tags = Recipe.tags.through
+    for start in range(0, len(recipe_ids), batch_size):
+        batch = recipe_ids[start:start + batch_size]
+        with transaction.atomic():
+            AmountImgredientsInRecipe.objects.bulk_create([
+                AmountImgredientsInRecipe(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_id,
+                    amount=rng.randint(1, 500),
+                )
+                for recipe_id in batch
+                for ingredient_id in rng.sample(
+                    ingredient_ids,
+                    min(len(ingredient_ids), rng.randint(3, 10))
+                )
+            ])
+            tags.objects.bulk_create([
+                tags(recipe_id=recipe_id, tag_id=tag_id)
+                for recipe_id in batch
+                for tag_id in rng.sample(
+                    tag_ids, min(len(tag_ids), rng.randint(1, 3))
+                )
+            ])
+        yield start + len(batch)
+
+
+def seed_links(model, field, user_ids, target_ids, per_user, exponent,
+               batch_size=10000, rng=random):
+    """
+    Связи пользователь -> объект с популярностью по закону Ципфа:
+    в среднем per_user на пользователя, число у каждого экспоненциальное.
+    """
+    weights = power_law_weights(len(target_ids), exponent)
+    rows = []
+    for user_id in user_ids:
+        count = min(int(rng.expovariate(1 / per_user)), len(target_ids))
+        targets = set(rng.choices(target_ids, cum_weights=weights, k=count))
+        targets.discard(user_id if model is Follow else None)
+        rows.extend(
+            model(user_id=user_id, **{field: target_id})
+            for target_id in targets
+        )
+        if len(rows) >= batch_size:
+            model.objects.bulk_create(rows, ignore_conflicts=True)
+            yield len(rows)
+            rows = []
+    if rows:
+        model.objects.bulk_create(rows, ignore_conflicts=True)
+        yield len(rows)
+
+
+def seed_follows(user_ids, author_ids, per_user, exponent=1.1, **kwargs):
+    return seed_links(
+        Follow, 'author_id', user_ids, author_ids, per_user, exponent,
+        **kwargs
+    )
+
+
+def seed_favorites(user_ids, recipe_ids, per_user, exponent=1.0, **kwargs):
+    return seed_links(
+        FavoriteRecipe, 'recipe_id', user_ids, recipe_ids, per_user,
+        exponent, **kwargs
+    )
+
+
+def seed_carts(user_ids, recipe_ids, per_user, exponent=1.0, **kwargs):
+    return seed_links(
+        ShoppingCart, 'recipe_id', user_ids, recipe_ids, per_user,
+        exponent, **kwargs
+    )
@@ -0,0 +1,67 @@
+import base64
+import io
+import json
+import struct
+import zlib
+
+import pytest
+from PIL import Image
+
+from api.parsers import PayloadTooLarge, RecipeJSONParser
+
+
+def png_data_uri(content=None):
+    if content is None:
+        buffer = io.BytesIO()
+        Image.new('RGB', (4, 4), 'red').save(buffer, format='PNG')
+        content = buffer.getvalue()
+    encoded = base64.b64encode(content).decode()
+    return f'data:image/png;base64,{encoded}'
+
+
+def png_chunk(kind, data):
+    body = kind + data
+    return (
+        struct.pack('>I', len(data)) + body
+        + struct.pack('>I', zlib.crc32(body))
+    )
+
+
+def png_header(width, height):
+    """Маленький PNG, у которого в IHDR заявлен размер width x height."""
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + png_chunk(b'IHDR', struct.pack(
+            '>IIBBBBB', width, height, 8, 2, 0, 0, 0
+        ))
+        + png_chunk(b'IDAT', zlib.compress(b''))
+        + png_chunk(b'IEND', b'')
+    )
+
+
+def parse(body, chunk_size):
+    parser = RecipeJSONParser()
+    parser.chunk_size = chunk_size
+    return parser.parse(io.BytesIO(body))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 4, 5, 7, 64, 65536])
+def test_image_parsed_at_any_chunk_size(chunk_size):
+    body = json.dumps({'name': 'Суп', 'image': png_data_uri()}).encode()
+    data = parse(body, chunk_size)
+    assert data['name'] == 'Суп'
+    assert Image.open(data['image']).size == (4, 4)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 65536])
+def test_raw_base64_image_parsed(chunk_size):
+    image = png_data_uri().split(',', 1)[1]
+    body = json.dumps({'image': image}).encode()
+    assert Image.open(parse(body, chunk_size)['image']).size == (4, 4)
+
+
+@pytest.mark.parametrize('side', [9000, 20000])
+def test_image_resolution_limited(side):
+    body = json.dumps({'image': png_data_uri(png_header(side, side))})
+    with pytest.raises(PayloadTooLarge):
+        parse(body.encode(), 65536)
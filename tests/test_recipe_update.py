@@ -0,0 +1,161 @@
+import base64
+import io
+
+import pytest
+from django.core.cache import cache
+from PIL import Image
+from rest_framework.test import APIClient
+
+from api.cache import local_cache
+from recipes.models import AmountImgredientsInRecipe, Ingredient, Recipe, Tag
+from users.models import User
+
+AMOUNTS_TABLE = AmountImgredientsInRecipe._meta.db_table
+
+
+def png_data_uri():
+    buffer = io.BytesIO()
+    Image.new('RGB', (4, 4), 'red').save(buffer, format='PNG')
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/png;base64,{encoded}'
+
+
+@pytest.fixture(autouse=True)
+def media(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+
+
+@pytest.fixture
+def author():
+    return User.objects.create_user(
+        email='author@foodgram.ru', username='author', password='pass',
+        first_name='Автор', last_name='Рецептов'
+    )
+
+
+@pytest.fixture
+def client(author):
+    client = APIClient()
+    client.force_authenticate(author)
+    return client
+
+
+@pytest.fixture
+def tags():
+    return [
+        Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}', slug=f'tag{i}')
+        for i in range(2)
+    ]
+
+
+@pytest.fixture
+def ingredients():
+    return [
+        Ingredient.objects.create(name=name, measurement_unit='г')
+        for name in ('мука', 'сахар', 'соль', 'масло')
+    ]
+
+
+@pytest.fixture
+def payload(tags, ingredients):
+    return {
+        'name': 'Пирог',
+        'text': 'Смешать и испечь.',
+        'cooking_time': 40,
+        'image': png_data_uri(),
+        'tags': [tag.id for tag in tags],
+        'ingredients': [
+            {'id': ingredient.id, 'amount': 100}
+            for ingredient in ingredients[:3]
+        ],
+    }
+
+
+@pytest.fixture
+def recipe(client, payload):
+    response = client.post('/api/recipes/', payload, format='json')
+    assert response.status_code == 201, response.data
+    return Recipe.objects.get()
+
+
+def edit(client, recipe, method, data, queries, assert_num_queries):
+    cache.clear()
+    local_cache.clear()
+    with assert_num_queries(queries) as captured:
+        response = getattr(client, method)(
+            f'/api/recipes/{recipe.id}/', data, format='json'
+        )
+    assert response.status_code == 200, response.data
+    return [
+        query['sql'] for query in captured.captured_queries
+        if AMOUNTS_TABLE in query['sql']
+        and not query['sql'].startswith('SELECT')
+    ]
+
+
+def amounts(recipe):
+    return dict(recipe.amount_ingredient.values_list(
+        'ingredient_id', 'amount'
+    ))
+
+
+def with_amounts(payload, changes):
+    return {**payload, 'ingredients': changes(payload['ingredients'])}
+
+
+@pytest.mark.django_db
+def test_unchanged_put_writes_no_ingredients(
+    client, recipe, payload, django_assert_num_queries
+):
+    before = amounts(recipe)
+    writes = edit(client, recipe, 'put', payload, 17, django_assert_num_queries)
+    assert writes == []
+    assert amounts(recipe) == before
+
+
+@pytest.mark.django_db
+def test_one_amount_edit_is_single_update(
+    client, recipe, payload, ingredients, django_assert_num_queries
+):
+    data = with_amounts(payload, lambda rows: [
+        {**rows[0], 'amount': 150}, *rows[1:]
+    ])
+    writes = edit(client, recipe, 'put', data, 18, django_assert_num_queries)
+    assert [sql.split()[0] for sql in writes] == ['UPDATE']
+    assert amounts(recipe)[ingredients[0].id] == 150
+
+
+@pytest.mark.django_db
+def test_added_ingredient_is_single_insert(
+    client, recipe, payload, ingredients, django_assert_num_queries
+):
+    data = with_amounts(payload, lambda rows: [
+        *rows, {'id': ingredients[3].id, 'amount': 5}
+    ])
+    writes = edit(client, recipe, 'put', data, 18, django_assert_num_queries)
+    assert [sql.split()[0] for sql in writes] == ['INSERT']
+    assert amounts(recipe)[ingredients[3].id] == 5
+
+
+@pytest.mark.django_db
+def test_removed_ingredient_is_single_delete(
+    client, recipe, payload, ingredients, django_assert_num_queries
+):
+    data = with_amounts(payload, lambda rows: rows[:2])
+    # DELETE с сигналами сначала выбирает удаляемые строки.
+    writes = edit(client, recipe, 'put', data, 19, django_assert_num_queries)
+    assert [sql.split()[0] for sql in writes] == ['DELETE']
+    assert ingredients[2].id not in amounts(recipe)
+
+
+@pytest.mark.django_db
+def test_patch_without_ingredients_keeps_them(
+    client, recipe, django_assert_num_queries
+):
+    before = amounts(recipe)
+    writes = edit(
+        client, recipe, 'patch', {'name': 'Торт'}, 9,
+        django_assert_num_queries
+    )
+    assert writes == []
+    assert amounts(recipe) == before
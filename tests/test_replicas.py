@@ -0,0 +1,100 @@
+from contextlib import ExitStack
+
+import pytest
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.test import APIClient
+
+from api.routers import replica_aliases
+from users.models import User
+
+pytestmark = [
+    pytest.mark.skipif(not replica_aliases(), reason='нет реплики'),
+    pytest.mark.django_db(
+        transaction=True, databases=[DEFAULT_DB_ALIAS, *replica_aliases()]
+    ),
+]
+
+
+@pytest.fixture(autouse=True)
+def clear_pins():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def users():
+    return [
+        User.objects.create_user(
+            email=f'cook{i}@foodgram.ru', username=f'cook{i}',
+            password='pass', first_name='Повар', last_name='Поваров'
+        )
+        for i in range(2)
+    ]
+
+
+def login(user):
+    client = APIClient()
+    response = client.post(
+        '/api/auth/token/login/',
+        {'email': user.email, 'password': 'pass'}
+    )
+    assert response.status_code == 200, response.data
+    token = response.data['auth_token']
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+    return client
+
+
+def get(client, path):
+    """Ответ и пары (база, SQL) всех запросов, сделанных по пути."""
+    queries = []
+
+    def record(execute, sql, params, many, context):
+        queries.append((context['connection'].alias, sql))
+        return execute(sql, params, many, context)
+
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(record))
+        response = client.get(path)
+    assert response.status_code == 200, response.data
+    return queries
+
+
+def aliases(queries):
+    return {alias for alias, sql in queries}
+
+
+def test_login(users):
+    """
+    Свежий токен ищется в основной базе, вошедший читает оттуда же.
+    Когда закрепление истекло, остальное чтение уходит на реплику.
+    """
+    client = login(users[0])
+    queries = get(client, '/api/users/subscriptions/')
+    assert aliases(queries) == {DEFAULT_DB_ALIAS}
+
+    cache.clear()
+    queries = get(client, '/api/users/subscriptions/')
+    assert {
+        alias for alias, sql in queries if 'authtoken_token' in sql
+    } == {DEFAULT_DB_ALIAS}
+    assert aliases(queries) - {DEFAULT_DB_ALIAS} <= set(replica_aliases())
+    assert len(aliases(queries)) == 2
+
+
+def test_read_after_write(users):
+    client = login(users[0])
+    cache.clear()
+    response = client.post(f'/api/users/{users[1].id}/subscribe/')
+    assert response.status_code == 201, response.data
+    assert aliases(
+        get(client, '/api/users/subscriptions/')
+    ) == {DEFAULT_DB_ALIAS}
+
+    other = login(users[1])
+    cache.clear()
+    assert aliases(
+        get(other, '/api/users/subscriptions/')
+    ) - {DEFAULT_DB_ALIAS} == set(replica_aliases())
@@ -0,0 +1,60 @@
+import pytest
+from rest_framework.test import APIClient
+
+from recipes.models import (
+    AmountImgredientsInRecipe, Ingredient, Recipe, ShoppingListItem
+)
+from users.models import User
+
+INGREDIENTS_COUNT = 1200
+
+
+@pytest.fixture
+def user():
+    return User.objects.create_user(
+        email='cook@foodgram.ru', username='cook', password='pass',
+        first_name='Повар', last_name='Поваров'
+    )
+
+
+@pytest.fixture
+def client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@pytest.fixture
+def recipe(user):
+    recipe = Recipe.objects.create(
+        author=user, name='Большой салат', text='Всё нарезать.',
+        cooking_time=30, image='recipes/salad.png'
+    )
+    Ingredient.objects.bulk_create([
+        Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+        for i in range(INGREDIENTS_COUNT)
+    ])
+    ingredients = Ingredient.objects.order_by('id')
+    AmountImgredientsInRecipe.objects.bulk_create([
+        AmountImgredientsInRecipe(
+            recipe=recipe, ingredient=ingredient, amount=index + 1
+        )
+        for index, ingredient in enumerate(ingredients)
+    ])
+    return recipe
+
+
+@pytest.mark.django_db
+def test_cart_with_many_ingredients(client, user, recipe):
+    """Пачки списка покупок не упираются в лимиты SQLite."""
+    response = client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+    assert response.status_code == 201, response.data
+    items = ShoppingListItem.objects.filter(user=user)
+    assert items.count() == INGREDIENTS_COUNT
+    assert sum(items.values_list('total_amount', flat=True)) == sum(
+        range(1, INGREDIENTS_COUNT + 1)
+    )
+
+    response = client.delete(f'/api/recipes/{recipe.id}/shopping_cart/')
+    assert response.status_code == 204
+    assert not ShoppingListItem.objects.filter(user=user).exists()